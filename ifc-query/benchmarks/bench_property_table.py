@@ -0,0 +1,110 @@
+"""
+Compare the legacy row-dict property table with the columnar one.
+
+Builds synthetic IFCX models with a fixed number of attributes, then runs
+each table builder on them and reports build time, peak Python allocations
+during the build, and the memory held by the resulting DataFrame.
+
+Usage:
+    python benchmarks/bench_property_table.py [--sizes 10000 100000 1000000]
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from ifc_query.util.ifc import IGNORE_ATTRS, ifcx_to_df
+
+PROPERTIES = ['customdata', 'ifc5:class', 'ifc5:properties', 'nlsfb:class', 'xformOp']
+ATTRIBUTES_PER_PRIM = len(PROPERTIES)
+
+
+def synthetic_ifcx(n_attributes: int) -> bytes:
+    """Generate an IFCX document with n_attributes flattened attributes"""
+    objects = []
+    for i in range(0, n_attributes, ATTRIBUTES_PER_PRIM):
+        name = f"N{i:032x}"
+        objects.append({
+            "def": "class",
+            "type": "UsdGeom:Xform",
+            "name": name,
+        })
+        attributes = {
+            'customdata': {"originalStepInstance": f"#{i}=IFCWALL('{name}')"},
+            'ifc5:class': {"code": "IfcWall", "uri": "https://identifier.buildingsmart.org/uri/buildingsmart/ifc/4.3/class/IfcWall"},
+            'ifc5:properties': {"IsExternal": i % 2 == 0, "Width": 0.1 + i % 7},
+            'nlsfb:class': {"code": "21.21", "uri": "https://identifier.buildingsmart.org/uri/nlsfb/nlsfb2005/2.2/class/21.21"},
+            'xformOp': {"transform": [[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0], [i * 0.5, 0, 0, 1]]},
+        }
+        n = min(ATTRIBUTES_PER_PRIM, n_attributes - i)
+        objects.append({
+            "def": "over",
+            "name": name,
+            "attributes": {prop: attributes[prop] for prop in PROPERTIES[:n]},
+        })
+    return json.dumps(objects).encode()
+
+
+def legacy_ifcx_to_df(ifcx_file: io.BytesIO) -> pd.DataFrame:
+    """The original implementation: json.load, then one dict per attribute"""
+    data = json.load(ifcx_file)
+    filtered_data = [obj for obj in data if obj.get("def") == "over" and "attributes" in obj]
+    flattened_data = []
+    for obj in filtered_data:
+        for prop, value in obj.get('attributes', {}).items():
+            if prop in IGNORE_ATTRS:
+                continue
+            flattened_data.append({
+                'id': obj.get('name'),
+                'property': prop,
+                'value': json.dumps(value)
+            })
+    return pd.DataFrame(flattened_data)
+
+
+def measure(build, raw: bytes):
+    # Time and trace separately, tracemalloc slows allocation-heavy code down a lot
+    gc.collect()
+    start = time.perf_counter()
+    build(io.BytesIO(raw))
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    df = build(io.BytesIO(raw))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    held = df.memory_usage(deep=True).sum()
+    return elapsed, peak, held, len(df)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    builders = {
+        'legacy rows': legacy_ifcx_to_df,
+        'categorical': ifcx_to_df,
+        'arrow': lambda f: ifcx_to_df(f, dtype_backend='pyarrow'),
+    }
+
+    print(f"{'attributes':>10}  {'builder':<12} {'time (s)':>9} {'peak (MB)':>10} {'table (MB)':>11}")
+    for size in args.sizes:
+        raw = synthetic_ifcx(size)
+        for label, build in builders.items():
+            elapsed, peak, held, rows = measure(build, raw)
+            assert rows == size, f"{label} produced {rows} rows, expected {size}"
+            print(f"{size:>10}  {label:<12} {elapsed:>9.3f} {peak / 1e6:>10.1f} {held / 1e6:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Load test for session lookups, the query require_auth runs on every rerun.
+
+Fills a scratch database with sessions, then has a number of threads look
+up random sessions concurrently, first with the original connection per
+call and then through the connection pool in util/db.py, and reports the
+latency percentiles and throughput of each.
+
+Usage:
+    python benchmarks/load_sessions.py [--threads 16] [--lookups 2000] [--sessions 10000]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from ifc_query.util import db
+
+
+def create_sessions(n_sessions: int) -> list:
+    """Create the users and sessions tables in db.DB_PATH and fill them, returning the session ids"""
+    conn = sqlite3.connect(db.DB_PATH)
+    conn.execute('CREATE TABLE users (login TEXT PRIMARY KEY, name TEXT NOT NULL)')
+    conn.execute('''
+        CREATE TABLE sessions (
+            session_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            access_token TEXT NOT NULL,
+            expires_at TIMESTAMP NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(login)
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_sessions_expiry ON sessions(session_id, expires_at)')
+    expiry = datetime.now() + timedelta(days=30)
+    session_ids = [f"session-{i}" for i in range(n_sessions)]
+    conn.executemany(
+        'INSERT INTO sessions (session_id, user_id, access_token, expires_at) VALUES (?, ?, ?, ?)',
+        [(session_id, f"user-{i % 100}", f"token-{i}", expiry) for i, session_id in enumerate(session_ids)]
+    )
+    conn.commit()
+    conn.close()
+    return session_ids
+
+
+def legacy_get_session(session_id: str):
+    """The original get_session: a fresh connection per lookup"""
+    conn = sqlite3.connect(db.DB_PATH)
+    cursor = conn.cursor()
+    query = """
+        SELECT user_id, access_token, expires_at
+        FROM sessions
+        WHERE session_id = ? AND expires_at > ?
+    """
+    result = cursor.execute(query, (session_id, datetime.now())).fetchone()
+    conn.close()
+    if result:
+        return {'user_id': result[0], 'access_token': result[1], 'expires_at': result[2]}
+    return None
+
+
+def run(get_session, session_ids: list, n_threads: int, n_lookups: int) -> dict:
+    """Run n_lookups lookups on each of n_threads threads, returning latency stats in milliseconds"""
+    latencies = [[] for _ in range(n_threads)]
+    barrier = threading.Barrier(n_threads + 1)
+
+    def worker(out: list, seed: int):
+        rng = random.Random(seed)
+        barrier.wait()
+        for _ in range(n_lookups):
+            session_id = rng.choice(session_ids)
+            start = time.perf_counter()
+            if get_session(session_id) is None:
+                raise RuntimeError(f"Session {session_id} not found")
+            out.append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=worker, args=(out, i)) for i, out in enumerate(latencies)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    all_latencies = sorted(latency for out in latencies for latency in out)
+    quantiles = statistics.quantiles(all_latencies, n=100)
+    return {
+        'p50': quantiles[49],
+        'p99': quantiles[98],
+        'max': all_latencies[-1],
+        'throughput': len(all_latencies) / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--lookups', type=int, default=2000, help="Lookups per thread")
+    parser.add_argument('--sessions', type=int, default=10_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        db.DB_PATH = Path(folder) / 'info.db'
+        session_ids = create_sessions(args.sessions)
+        # Both variants run against the same WAL database
+        with db.connection():
+            pass
+
+        print(f"{args.threads} threads x {args.lookups} lookups, {args.sessions} sessions")
+        print(f"{'':<12} {'p50 ms':>10} {'p99 ms':>10} {'max ms':>10} {'lookups/s':>12}")
+        for label, get_session in [('per call', legacy_get_session), ('pooled', db.get_session)]:
+            stats = run(get_session, session_ids, args.threads, args.lookups)
+            print(f"{label:<12} {stats['p50']:>10.3f} {stats['p99']:>10.3f} {stats['max']:>10.3f} {stats['throughput']:>12.0f}")
+
+        db._pools.pop(str(db.DB_PATH)).close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,335 @@
+"""
+Command-line tools for IFCX files, for use in scripts and CI without the Streamlit UI.
+
+Usage:
+    ifcx flatten model.ifcx overlay.ifcx -o properties.parquet
+    ifcx sql model.ifcx -q "SELECT id, value FROM props WHERE property = 'ifc5:class'"
+    ifcx apply edits.csv -o model_edits.ifcx --check model.ifcx
+    ifcx spatial model.ifcx --near 5 0 1.5 --radius 2
+
+Files given together are composed as layers, base model first. Heavy
+imports are deferred to the subcommand that needs them, so --help and
+argument errors return immediately.
+"""
+import argparse
+import csv
+import itertools
+import os
+import sqlite3
+import sys
+import tempfile
+from logging import log, WARN
+from typing import Iterator, List, Optional, Tuple
+
+Row = Tuple[str, str, str]
+
+ROW_BATCH = 10_000
+
+
+def _open_output(path: str, binary: bool = False):
+    """Open an output file, '-' meaning stdout"""
+    if path == '-':
+        return sys.stdout.buffer if binary else sys.stdout
+    if binary:
+        return open(path, 'wb')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def _output_format(path: str, fmt: Optional[str]) -> str:
+    if fmt:
+        return fmt
+    return 'parquet' if path.endswith('.parquet') else 'csv'
+
+
+def _compose(files: List[str], jobs: Optional[int] = 1, with_meshes: bool = False):
+    """The Stage of the given IFCX layers, with or without their mesh attributes"""
+    from ifc_query.util.batch import parse_layers
+    from ifc_query.util.compose import Stage
+    from ifc_query.util.ifc import IGNORE_ATTRS
+    from ifc_query.util.mesh import MESH_ATTR
+
+    skip = [attr for attr in IGNORE_ATTRS if not (with_meshes and attr == MESH_ATTR)]
+    return Stage(parse_layers(files, max_workers=jobs, skip_attributes=skip))
+
+
+def iter_rows(files: List[str], overs_only: bool = False, jobs: Optional[int] = 1,
+              geometry: bool = False) -> Iterator[Row]:
+    """
+    The (id, property, value) rows of the given IFCX files.
+
+    Args:
+        files: Paths of IFCX files, composed as layers in order
+        overs_only: Only flatten the top-level overs of a single file, like ifcx_to_df
+        jobs: Processes used to parse the files, None for one per CPU
+        geometry: Also yield the world:xform and world:bbox rows of every prim
+    """
+    from ifc_query.util.compose import iter_stage_rows
+    from ifc_query.util.ifc import IGNORE_ATTRS, iter_ifcx_rows
+
+    if overs_only:
+        if len(files) != 1:
+            raise ValueError("--overs flattens a single file")
+        if geometry:
+            raise ValueError("--geometry needs the composed stage, it cannot be used with --overs")
+        with open(files[0], 'rb') as f:
+            for batch in iter_ifcx_rows(f):
+                yield from batch
+        return
+
+    stage = _compose(files, jobs, with_meshes=geometry)
+    yield from iter_stage_rows(stage, ignore_attrs=IGNORE_ATTRS)
+    if geometry:
+        from ifc_query.util.geometry import compute_geometry, iter_geometry_rows
+        yield from iter_geometry_rows(compute_geometry(stage))
+
+
+def _batched(rows, size: int) -> Iterator[list]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def write_rows(rows, columns: List[str], path: str, fmt: str) -> int:
+    """
+    Stream rows to CSV or Parquet in batches, returning the number of rows written.
+
+    Parquet column types are guessed from the first batch, see results.write_parquet.
+    """
+    n_rows = 0
+    if fmt == 'csv':
+        out = _open_output(path)
+        try:
+            writer = csv.writer(out)
+            writer.writerow(columns)
+            for batch in _batched(rows, ROW_BATCH):
+                writer.writerows(batch)
+                n_rows += len(batch)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        return n_rows
+
+    from ifc_query.util.results import write_parquet
+
+    out = _open_output(path, binary=True)
+    try:
+        return write_parquet(out, columns, _batched(rows, ROW_BATCH))
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+
+
+def flatten(args) -> int:
+    rows = iter_rows(args.files, overs_only=args.overs, jobs=args.jobs, geometry=args.geometry)
+    n_rows = write_rows(rows, ['id', 'property', 'value'], args.output, _output_format(args.output, args.format))
+    print(f"Wrote {n_rows} properties to {args.output}", file=sys.stderr)
+    return 0
+
+
+def sql(args) -> int:
+    from ifc_query.util.ingest import (
+        get_models_connection, ingest_rows, model_leaves_table_name, model_rtree_table_name, model_table_name
+    )
+    from ifc_query.util.results import time_limit
+
+    query = args.query
+    if query is None:
+        query = sys.stdin.read()
+
+    with tempfile.TemporaryDirectory() as folder:
+        conn = get_models_connection(args.db or os.path.join(folder, 'models.db'))
+        try:
+            if args.files:
+                ingest_rows(conn, args.model, iter_rows(
+                    args.files, overs_only=args.overs, jobs=args.jobs, geometry=args.geometry
+                ))
+            # Short names for the model's tables, for this connection only
+            conn.execute(f'CREATE TEMP VIEW props AS SELECT * FROM "{model_table_name(args.model)}"')
+            conn.execute(f'CREATE TEMP VIEW props_leaves AS SELECT * FROM "{model_leaves_table_name(args.model)}"')
+            rtree = model_rtree_table_name(args.model)
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (rtree,)).fetchone():
+                conn.execute(f'CREATE TEMP VIEW props_rtree AS SELECT * FROM "{rtree}"')
+
+            with time_limit(conn, args.timeout):
+                cursor = conn.execute(query)
+                columns = [column[0] for column in cursor.description or ()]
+                # Rows are fetched in batches as they are written
+                rows = itertools.chain.from_iterable(iter(lambda: cursor.fetchmany(ROW_BATCH), []))
+                n_rows = write_rows(
+                    itertools.islice(rows, args.limit), columns, args.output, _output_format(args.output, args.format)
+                )
+        finally:
+            conn.close()
+    print(f"{n_rows} rows", file=sys.stderr)
+    return 0
+
+
+def apply(args) -> int:
+    import pandas as pd
+    from ifc_query.util.ifc import write_ifcx
+
+    edits = pd.read_csv(args.edits, dtype=str, keep_default_na=False)
+
+    if args.check:
+        # Report edits to objects or properties the model does not have
+        known = {(id_, prop) for id_, prop, _ in iter_rows(args.check, jobs=args.jobs)}
+        known_ids = {id_ for id_, _ in known}
+        n_unknown = 0
+        for id_, prop in zip(edits['id'], edits['property']):
+            if id_ not in known_ids:
+                log(WARN, f"Edit targets unknown object {id_}")
+                n_unknown += 1
+            elif (id_, prop) not in known:
+                log(WARN, f"Edit adds property {prop} to {id_}")
+        if n_unknown and args.strict:
+            print(f"{n_unknown} edits target objects that are not in the model", file=sys.stderr)
+            return 1
+
+    out = _open_output(args.output)
+    try:
+        write_ifcx(edits, out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"Wrote {len(edits)} edits to {args.output}", file=sys.stderr)
+    return 0
+
+
+def spatial(args) -> int:
+    import numpy as np
+    from ifc_query.util.geometry import compute_geometry
+    from ifc_query.util.spatial import box_distance, geometry_bvh, is_ancestor_pair
+
+    geometry = compute_geometry(_compose(args.files, args.jobs, with_meshes=True))
+    fmt = _output_format(args.output, args.format)
+
+    if args.clash:
+        # Groups always enclose their contents, so only prims with meshes of their own can clash
+        first = geometry_bvh(geometry, own_meshes_only=True, pattern=args.select)
+        second = geometry_bvh(geometry, own_meshes_only=True, pattern=args.against) if args.against else None
+        other = second or first
+        pairs = (
+            (first.ids[i], other.ids[j])
+            for i, j in first.clash_pairs(second, tolerance=args.tolerance).tolist()
+            if first.ids[i] != other.ids[j] and not is_ancestor_pair(first.ids[i], other.ids[j])
+        )
+        n_rows = write_rows(pairs, ['path_a', 'path_b'], args.output, fmt)
+        print(f"{n_rows} clashing pairs", file=sys.stderr)
+        return 0
+
+    bvh = geometry_bvh(geometry, own_meshes_only=args.meshes_only, pattern=args.select)
+    if args.box:
+        indices = bvh.query_box(args.box[:3], args.box[3:])
+        n_rows = write_rows(([bvh.ids[i]] for i in indices), ['path'], args.output, fmt)
+    else:
+        if args.radius is not None:
+            indices = bvh.query_radius(args.near, args.radius)
+            distances = box_distance(bvh.bbox_min[indices], bvh.bbox_max[indices], args.near)
+            order = np.argsort(distances, kind='stable')
+            indices, distances = indices[order], distances[order]
+        else:
+            indices, distances = bvh.nearest(args.near, args.k)
+        rows = ((bvh.ids[i], distance) for i, distance in zip(indices.tolist(), distances.tolist()))
+        n_rows = write_rows(rows, ['path', 'distance'], args.output, fmt)
+    print(f"{n_rows} prims", file=sys.stderr)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='ifcx', description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_model_options(subparser, files_nargs='+'):
+        subparser.add_argument('files', nargs=files_nargs, help="IFCX files, composed as layers in order (base model first)")
+        subparser.add_argument('--overs', action='store_true',
+                               help="Only flatten the top-level overs of a single file, without composing")
+        subparser.add_argument('--geometry', action='store_true',
+                               help="Add the world:xform and world:bbox of every prim, keyed by prim path")
+        subparser.add_argument('-j', '--jobs', type=int, default=1,
+                               help="Processes used to parse the files, 0 for one per CPU (default: 1)")
+
+    flatten_parser = subparsers.add_parser('flatten', help="Flatten IFCX files to an (id, property, value) table")
+    add_model_options(flatten_parser)
+    flatten_parser.add_argument('-o', '--output', default='-', help="Output file, '-' for stdout (default)")
+    flatten_parser.add_argument('--format', choices=['csv', 'parquet'], help="Defaults to the output extension, or csv")
+    flatten_parser.set_defaults(run=flatten)
+
+    sql_parser = subparsers.add_parser('sql', help="Run SQL over IFCX files",
+                                       description="Runs a query against the table 'props' (id, property, value) "
+                                                   "and 'props_leaves' (id, property, json_path, num_value, str_value); "
+                                                   "with --geometry, also 'props_rtree' (id, min_x, max_x, min_y, "
+                                                   "max_y, min_z, max_z, path), an R*Tree of the prims' world "
+                                                   "bounding boxes, and bbox_distance(min_x, min_y, min_z, max_x, "
+                                                   "max_y, max_z, x, y, z).")
+    add_model_options(sql_parser, files_nargs='*')
+    sql_parser.add_argument('-q', '--query', help="The SQL query, read from stdin if omitted")
+    sql_parser.add_argument('-o', '--output', default='-', help="Output file, '-' for stdout (default)")
+    sql_parser.add_argument('--format', choices=['csv', 'parquet'], help="Defaults to the output extension, or csv")
+    sql_parser.add_argument('--db', help="Keep the ingested model in this SQLite database instead of a temporary one")
+    sql_parser.add_argument('--model', default='model', help="Model name in the database (default: model)")
+    sql_parser.add_argument('--limit', type=int, help="Maximum number of rows to output")
+    sql_parser.add_argument('--timeout', type=float, help="Interrupt the query after this many seconds")
+    sql_parser.set_defaults(run=sql)
+
+    apply_parser = subparsers.add_parser('apply', help="Turn an edits CSV (id, property, value) into an IFCX overlay")
+    apply_parser.add_argument('edits', help="CSV file with columns id, property, value (JSON-encoded)")
+    apply_parser.add_argument('-o', '--output', default='-', help="Output IFCX file, '-' for stdout (default)")
+    apply_parser.add_argument('--check', nargs='+', metavar='FILE', help="Warn about edits not matching these IFCX layers")
+    apply_parser.add_argument('--strict', action='store_true', help="With --check, fail on edits to unknown objects")
+    apply_parser.add_argument('-j', '--jobs', type=int, default=1, help="Processes used to parse the --check files")
+    apply_parser.set_defaults(run=apply)
+
+    spatial_parser = subparsers.add_parser('spatial', help="Find prims by world bounding box, or clashing pairs",
+                                           description="Spatial queries over the world bounding boxes of the "
+                                                       "composed prims, using a bounding-volume hierarchy.")
+    spatial_parser.add_argument('files', nargs='+', help="IFCX files, composed as layers in order (base model first)")
+    spatial_parser.add_argument('-j', '--jobs', type=int, default=1,
+                                help="Processes used to parse the files, 0 for one per CPU (default: 1)")
+    spatial_query = spatial_parser.add_mutually_exclusive_group(required=True)
+    spatial_query.add_argument('--box', nargs=6, type=float, metavar=('X0', 'Y0', 'Z0', 'X1', 'Y1', 'Z1'),
+                               help="Prims intersecting the box between two corners")
+    spatial_query.add_argument('--near', nargs=3, type=float, metavar=('X', 'Y', 'Z'),
+                               help="Prims near a point, with --radius or -k")
+    spatial_query.add_argument('--clash', action='store_true',
+                               help="Pairs of prims with meshes whose boxes intersect")
+    spatial_parser.add_argument('--radius', type=float, help="With --near, prims within this distance")
+    spatial_parser.add_argument('-k', type=int, default=1, help="With --near, the k nearest prims (default: 1)")
+    spatial_parser.add_argument('--select', metavar='GLOB', help="Only consider prims whose path matches, e.g. '*/Window*'")
+    spatial_parser.add_argument('--against', metavar='GLOB',
+                                help="With --clash, test the --select prims against these instead of each other")
+    spatial_parser.add_argument('--tolerance', type=float, default=0.0,
+                                help="With --clash, also report boxes closer than this")
+    spatial_parser.add_argument('--meshes-only', action='store_true',
+                                help="Only consider prims with a mesh of their own, not the groups enclosing them")
+    spatial_parser.add_argument('-o', '--output', default='-', help="Output file, '-' for stdout (default)")
+    spatial_parser.add_argument('--format', choices=['csv', 'parquet'], help="Defaults to the output extension, or csv")
+    spatial_parser.set_defaults(run=spatial)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, 'geometry', False) and args.overs:
+        parser.error("--geometry needs the composed stage, it cannot be used with --overs")
+    if getattr(args, 'jobs', 1) == 0:
+        args.jobs = None
+    try:
+        return args.run(args)
+    except BrokenPipeError:
+        # e.g. piped into head
+        sys.stderr.close()
+        return 0
+    except (OSError, ValueError, KeyError, sqlite3.Error) as e:
+        print(f"ifcx {args.command}: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,10 +6,10 @@ import logging
 sys.path.append(os.getcwd())
 
 import streamlit as st
-import requests
 from dotenv import load_dotenv
 from ifc_query.util.auth import require_auth
 from ifc_query.util.db import delete_session, ensure_db_exists
+from ifc_query.util.sweeper import start_session_sweeper
 from streamlit_cookies_manager  import EncryptedCookieManager
 
 st.set_page_config(
@@ -46,14 +46,9 @@ def github_login():
     github_auth_url = f'https://github.com/login/oauth/authorize?client_id={GITHUB_CLIENT_ID}&redirect_uri={REDIRECT_URI}&scope=read:user'
     st.markdown(f'<a href="{github_auth_url}" target="_self">Login with GitHub</a>', unsafe_allow_html=True)
 
-@st.cache_data
-def get_user_data(access_token):
-    headers = {'Authorization': f'token {access_token}'}
-    response = requests.get('https://api.github.com/user', headers=headers)
-    return response.json()
-
 def main():
     ensure_db_exists()
+    start_session_sweeper()
     st.title('GitHub Login Demo')
 
     # Check authentication - will stop execution if not authenticated
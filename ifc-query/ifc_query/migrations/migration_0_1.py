@@ -1,13 +1,17 @@
 import sqlite3
-from ifc_query import db
+from typing import Optional
+from ifc_query.util import db
 from logging import log, INFO
 
-def migrate():
+def migrate(connection: Optional[sqlite3.Connection] = None):
     """
     Initial migration that creates the schema_version table to track database versions.
     Migrates from version 0 (no version table) to version 1.
     """
-    connection = sqlite3.connect(db.DB_PATH)
+    # Run inside the caller's transaction when given a connection
+    own_connection = connection is None
+    if own_connection:
+        connection = sqlite3.connect(db.DB_PATH)
     cursor = connection.cursor()
 
     # Create the schema_version table
@@ -21,8 +25,9 @@ def migrate():
     # Insert initial version (1)
     cursor.execute('INSERT INTO schema_version (version) VALUES (?)', (1,))
 
-    connection.commit()
-    connection.close()
+    if own_connection:
+        connection.commit()
+        connection.close()
     log(INFO, "Applied migration 0 -> 1")
 
 if __name__ == '__main__':
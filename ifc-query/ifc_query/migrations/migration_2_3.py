@@ -1,13 +1,17 @@
 import sqlite3
-from ifc_query import db
+from typing import Optional
+from ifc_query.util import db
 from logging import log, INFO
 
-def migrate():
+def migrate(connection: Optional[sqlite3.Connection] = None):
     """
     Migration to add sessions table for secure token storage.
     Migrates from version 2 to version 3.
     """
-    connection = sqlite3.connect(db.DB_PATH)
+    # Run inside the caller's transaction when given a connection
+    own_connection = connection is None
+    if own_connection:
+        connection = sqlite3.connect(db.DB_PATH)
     cursor = connection.cursor()
 
     # Create the sessions table
@@ -31,8 +35,9 @@ def migrate():
     # Update schema version to 3
     cursor.execute('INSERT INTO schema_version (version) VALUES (?)', (3,))
 
-    connection.commit()
-    connection.close()
+    if own_connection:
+        connection.commit()
+        connection.close()
     log(INFO, "Applied migration 2 -> 3")
 
 if __name__ == '__main__':
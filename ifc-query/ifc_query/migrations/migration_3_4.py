@@ -0,0 +1,33 @@
+import sqlite3
+from typing import Optional
+from ifc_query.util import db
+from logging import log, INFO
+
+def migrate(connection: Optional[sqlite3.Connection] = None):
+    """
+    Migration to index sessions by expiry, so expired sessions can be swept
+    without scanning the table.
+    Migrates from version 3 to version 4.
+    """
+    # Run inside the caller's transaction when given a connection
+    own_connection = connection is None
+    if own_connection:
+        connection = sqlite3.connect(db.DB_PATH)
+    cursor = connection.cursor()
+
+    # The (session_id, expires_at) index only helps lookups by session_id
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sessions_expires_at
+        ON sessions(expires_at)
+    ''')
+
+    # Update schema version to 4
+    cursor.execute('INSERT INTO schema_version (version) VALUES (?)', (4,))
+
+    if own_connection:
+        connection.commit()
+        connection.close()
+    log(INFO, "Applied migration 3 -> 4")
+
+if __name__ == '__main__':
+    migrate()
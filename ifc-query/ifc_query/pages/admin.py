@@ -0,0 +1,88 @@
+import os
+import streamlit as st
+import pandas as pd
+from dotenv import load_dotenv
+from streamlit_cookies_manager import EncryptedCookieManager
+from ifc_query.util.auth import require_auth
+from ifc_query.util.logs import slowest_queries
+from ifc_query.util.sweeper import SWEEPER
+
+load_dotenv()
+
+# Comma-separated GitHub logins allowed to see this page
+ADMIN_LOGINS = {login.strip() for login in os.getenv('ADMIN_LOGINS', '').split(',') if login.strip()}
+
+cookies = EncryptedCookieManager(
+    prefix="ifc_query/",
+    password=os.getenv('COOKIE_PASSWORD', 'default-secret-key')
+)
+
+if not cookies.ready():
+    # Wait for the component to load and send us current cookies.
+    st.stop()
+
+require_auth(cookies, lambda : st.markdown("## Please return to the main page to login."))
+
+if st.session_state.user_data.get('login') not in ADMIN_LOGINS:
+    st.error("This page is only available to admins (see ADMIN_LOGINS).")
+    st.stop()
+
+st.title("Admin")
+
+# Expired sessions are deleted by the background sweeper started in main.py
+st.subheader("Session sweeper")
+metrics = SWEEPER.metrics()
+sweeps, swept, rows, errors = st.columns(4)
+sweeps.metric("Sweeps", metrics['sweeps'])
+swept.metric("Sessions swept", metrics['rows_swept_total'], delta=metrics['rows_swept_last'] or None)
+rows.metric("Sessions table rows", metrics['sessions_rows'] if metrics['sessions_rows'] is not None else "-")
+errors.metric("Failed sweeps", metrics['errors'])
+if metrics['last_sweep_at']:
+    st.caption(f"Last sweep at {metrics['last_sweep_at']}, took {metrics['last_sweep_seconds'] * 1000:.0f} ms")
+else:
+    st.caption("No sweep has run in this process yet")
+
+st.subheader("Slow queries")
+
+limit = st.slider("Number of queries", min_value=10, max_value=500, value=50, step=10)
+queries = slowest_queries(limit)
+
+if not queries:
+    st.info("No queries logged yet")
+    st.stop()
+
+df = pd.DataFrame([
+    {
+        'timestamp': timestamp,
+        'user': user,
+        'duration_ms': properties.get('duration_ms'),
+        'rows': properties.get('rows'),
+        'full_scans': ', '.join(properties.get('full_scans', [])),
+        'error': properties.get('error'),
+        'query': properties.get('query'),
+    }
+    for timestamp, user, properties in queries
+])
+st.dataframe(df, hide_index=True)
+
+# Tables that slow queries read in full are the candidates for new indexes
+scans = df.assign(table=df['full_scans'].str.split(', ')).explode('table')
+scans = scans[scans['table'].fillna('') != '']
+if not scans.empty:
+    st.subheader("Full table scans")
+    st.write("Tables read in full by the queries above, by total time spent. "
+             "Check their filters for columns worth indexing.")
+    st.dataframe(
+        scans.groupby('table')
+            .agg(queries=('query', 'count'), total_ms=('duration_ms', 'sum'), max_ms=('duration_ms', 'max'))
+            .sort_values('total_ms', ascending=False),
+    )
+
+st.subheader("Query plans")
+for timestamp, user, properties in queries[:20]:
+    duration = properties.get('duration_ms') or 0
+    flag = " - full scan" if properties.get('full_scans') else ""
+    with st.expander(f"{duration:.0f} ms{flag} - {properties.get('query', '')[:80]}"):
+        st.code(properties.get('query', ''), language='sql')
+        st.code('\n'.join(properties.get('plan', [])) or "No plan recorded", language='text')
+        st.caption(f"{timestamp} by {user}")
@@ -2,8 +2,9 @@ import streamlit as st
 import requests
 import os
 from dotenv import load_dotenv
+from ifc_query.util.auth import get_user_data
 from ifc_query.util.db import store_session
-from ifc_query.logs import st_log
+from ifc_query.util.logs import st_log
 from streamlit_cookies_manager import EncryptedCookieManager
 
 # Hide this page from navigation
@@ -56,8 +57,8 @@ def main():
             st.json(response_json)
             access_token = response_json.get('access_token')
 
-            if access_token:
-                user_data = get_user_data(access_token)
+            user_data = get_user_data(access_token) if access_token else None
+            if user_data:
                 session_id = store_session(user_data['id'], access_token)
                 
                 # Only store the session ID in the cookie
@@ -67,6 +68,8 @@ def main():
                 st.session_state.access_token = access_token
                 st.session_state.user_data = user_data
                 st_log('login', {'username': user_data['login'], 'User-Agent': st.context.headers['User-Agent']})
+            elif access_token:
+                st.error('Authentication failed: the access token was rejected')
             else:
                 st.json(query_params)
                 st.error('Failed to obtain access token')
@@ -1,84 +1,168 @@
 import streamlit as st
 import pandas as pd
-from ifc_query.util.ifc import ifcx_to_df, df_to_ifcx
+from ifc_query.util.ifc import IGNORE_ATTRS, apply_stage_diff, filter_positions, df_to_ifcx
+from ifc_query.util.cache import cached_layers_to_df
+from ifc_query.util.compose import Stage
+from ifc_query.util.edits import EditBuffer
+from ifc_query.util.stream import iter_objects
 import io
 
+PAGE_SIZES = [50, 100, 500, 1000]
+
 def handle_data_editor_change():
     """Handle changes in the data editor"""
-    if 'data_editor' not in st.session_state or 'current_df' not in st.session_state:
+    editor_key = f"data_editor_{st.session_state.get('editor_version', 0)}"
+    if editor_key not in st.session_state or 'page_keys' not in st.session_state:
         return
 
-    edited_rows = st.session_state.data_editor['edited_rows']
-    current_df = st.session_state.current_df
+    edited_rows = st.session_state[editor_key]['edited_rows']
+    # The editor only holds the visible page, so its row positions are
+    # mapped back to the (id, property) keys of the rows shown on it
+    page_keys = st.session_state.page_keys
 
-    # Validate required columns exist
-    required_columns = ['id', 'property', 'value']
-    if not all(col in current_df.columns for col in required_columns):
-        st.error("Required columns (id, property, value) not found in the data")
-        return
-        
+    # edited_rows holds every change made in the widget so far, so only the
+    # rows that changed since the last callback make up this batch
+    applied = st.session_state.get('applied_rows', {})
+    batch = []
     for idx, changes in edited_rows.items():
-        if 'value' in changes:  # Only if value was changed
+        if 'value' in changes and applied.get(idx) != changes['value']:  # Only if value was changed
             try:
-                current_id = current_df.iloc[idx]['id']
-                current_property = current_df.iloc[idx]['property']
-                
-                # Check if we already have an edit for this id and property
-                mask = (st.session_state.edits['id'] == current_id) & \
-                       (st.session_state.edits['property'] == current_property)
-                
-                if mask.any():
-                    # Update existing edit
-                    st.session_state.edits.loc[mask, 'value'] = changes['value']
-                else:
-                    # Add new edit
-                    new_edit = pd.DataFrame({
-                        'id': [current_id],
-                        'property': [current_property],
-                        'value': [changes['value']]
-                    })
-                    st.session_state.edits = pd.concat([st.session_state.edits, new_edit], ignore_index=True)
+                current_id, current_property = page_keys[idx]
+                batch.append((current_id, current_property, changes['value']))
             except Exception as e:
                 st.error(f"Error processing edit: {str(e)}")
                 return
+    st.session_state.applied_rows = {idx: changes['value'] for idx, changes in edited_rows.items() if 'value' in changes}
+    st.session_state.edits.apply(batch)
+
+def reset_data_editor():
+    """Start a fresh data editor widget, e.g. after undo/redo changed the edits under it"""
+    st.session_state.editor_version = st.session_state.get('editor_version', 0) + 1
+    st.session_state.applied_rows = {}
+
+def undo_edit():
+    if st.session_state.edits.undo():
+        reset_data_editor()
+
+def redo_edit():
+    if st.session_state.edits.redo():
+        reset_data_editor()
+
+def compose_uploads(uploaded_files) -> pd.DataFrame:
+    """
+    Keep the composed property table in session state in step with the uploaded layers.
+
+    The first load in a session comes from the table cache when these layers
+    have been composed before, without building a stage. After that, layers
+    added or removed since the last rerun are applied to a stage
+    incrementally, and only the rows they change are patched into the
+    property table. The stage for the first load is built on the first such
+    change, from the layers it loaded: they are parsed again, but the table
+    is kept and only the prims the change touches are composed.
+    """
+    file_ids = [uploaded_file.file_id for uploaded_file in uploaded_files]
+    if st.session_state.get('stage_file_ids') == file_ids:
+        return st.session_state.stage_df
+
+    if 'stage_file_ids' not in st.session_state:
+        df = cached_layers_to_df(uploaded_files)
+        st.session_state.stage_files = list(uploaded_files)
+    else:
+        stage = st.session_state.get('stage')
+        if stage is None:
+            loaded_files = st.session_state.stage_files
+            for loaded_file in loaded_files:
+                loaded_file.seek(0)
+            stage = st.session_state.stage = Stage(
+                (iter_objects(loaded_file, skip_attributes=IGNORE_ATTRS) for loaded_file in loaded_files),
+                layer_ids=[loaded_file.file_id for loaded_file in loaded_files]
+            )
+            del st.session_state.stage_files
+        df = st.session_state.stage_df
+
+        for layer_id in [layer_id for layer_id in stage.layer_ids if layer_id not in file_ids]:
+            df = apply_stage_diff(df, stage.remove_layer(layer_id))
+        for index, uploaded_file in enumerate(uploaded_files):
+            if uploaded_file.file_id not in stage.layer_ids:
+                layer = iter_objects(uploaded_file, skip_attributes=IGNORE_ATTRS)
+                df = apply_stage_diff(df, stage.add_layer(layer, layer_id=uploaded_file.file_id, index=index))
+
+    st.session_state.stage_file_ids = file_ids
+    st.session_state.stage_df = df
+    return df
 
 def edit_page():
     st.title("Edit IFC Properties")
     
-    # File uploader
-    uploaded_file = st.file_uploader("Upload IFCX file", type=['ifcx'])
+    # File uploader, layers are composed in upload order (base model first)
+    uploaded_files = st.file_uploader("Upload IFCX files", type=['ifcx'], accept_multiple_files=True)
     
-    if uploaded_file is not None:
+    if uploaded_files:
         # Initialize session state for edits if not exists
         if 'edits' not in st.session_state:
-            st.session_state.edits = pd.DataFrame(columns=['id', 'property', 'value'])
+            st.session_state.edits = EditBuffer()
             
-        # Store original filename in session state
+        # Store original filename in session state, edits overlay the strongest layer
         if 'original_filename' not in st.session_state:
-            st.session_state.original_filename = uploaded_file.name
+            st.session_state.original_filename = uploaded_files[-1].name
             
-        # Convert IFCX to dataframe
-        df = ifcx_to_df(uploaded_file)
+        # Compose the IFCX layers and flatten the result to a dataframe
+        df = compose_uploads(uploaded_files)
         
         # Debug print
         st.write("DataFrame columns:", df.columns.tolist())
         
-        # Store current df in session state for access in callback
-        st.session_state.current_df = df
-        
+        # Validate required columns exist
+        required_columns = ['id', 'property', 'value']
+        if not all(col in df.columns for col in required_columns):
+            st.error("Required columns (id, property, value) not found in the data")
+            return
+
+        # Filter and page through the table on the server, only the visible
+        # page is sent to the data editor
+        id_col, property_col, size_col = st.columns([2, 2, 1])
+        id_pattern = id_col.text_input("Filter ids", help="Case-insensitive substring")
+        property_pattern = property_col.text_input("Filter properties", help="Case-insensitive substring")
+        page_size = size_col.selectbox("Rows per page", PAGE_SIZES, index=1)
+
+        positions = filter_positions(df, id_pattern, property_pattern)
+        n_pages = max(1, -(-len(positions) // page_size))
+        page = st.number_input("Page", min_value=1, max_value=n_pages, value=1, step=1)
+        page_positions = positions[(page - 1) * page_size:page * page_size]
+        st.caption(
+            f"Rows {(page - 1) * page_size + 1 if len(page_positions) else 0}-"
+            f"{(page - 1) * page_size + len(page_positions)} of {len(positions)} matching ({len(df)} total)"
+        )
+
+        # Pending edits are shown in place of the original values
+        page_df = st.session_state.edits.overlay(df.iloc[page_positions][required_columns].reset_index(drop=True))
+        st.session_state.page_keys = list(zip(page_df['id'], page_df['property']))
+
+        # A different window gets a fresh editor, so positional edits made on
+        # the previous page never land on the rows of this one
+        window = (tuple(st.session_state.stage_file_ids), id_pattern, property_pattern, page_size, page)
+        if st.session_state.get('editor_window') != window:
+            st.session_state.editor_window = window
+            reset_data_editor()
+
         # Create data editor with only value column editable
         edited_df = st.data_editor(
-            df,
+            page_df,
             disabled=['id', 'property'],
             hide_index=True,
-            key='data_editor',
+            key=f"data_editor_{st.session_state.get('editor_version', 0)}",
             on_change=handle_data_editor_change
         )
+
+        # Undo/redo whole batches of edits
+        undo_col, redo_col = st.columns(2)
+        undo_col.button("Undo", on_click=undo_edit, disabled=not st.session_state.edits.can_undo)
+        redo_col.button("Redo", on_click=redo_edit, disabled=not st.session_state.edits.can_redo)
         
         # Show current edits
-        if not st.session_state.edits.empty:
+        if st.session_state.edits:
             st.subheader("Current Edits")
-            st.dataframe(st.session_state.edits)
+            st.dataframe(st.session_state.edits.to_df())
             
             # Download button for edits
             if st.button("Download Edits"):
@@ -88,7 +172,7 @@ def edit_page():
                 new_filename = f"{base_name}_edits.ifcx"
                 
                 # Convert edits to IFCX
-                ifcx_content = df_to_ifcx(st.session_state.edits)
+                ifcx_content = df_to_ifcx(st.session_state.edits.to_df())
                 
                 # Create download button
                 st.download_button(
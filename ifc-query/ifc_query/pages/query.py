@@ -1,12 +1,160 @@
+import os
+import time
 import streamlit as st
-from ifc_query.db import get_db_connection
 import pandas as pd
-from ifc_query.auth_helpers import require_auth
+from dotenv import load_dotenv
+from streamlit_cookies_manager import EncryptedCookieManager
+from ifc_query.util.auth import require_auth
+from ifc_query.util.cache import QUERY_CACHE, query_key
+from ifc_query.util.geometry import compute_geometry
+from ifc_query.util.ingest import (
+    MAX_LEAVES_PER_VALUE, TRUNCATED_JSON_PATH, apply_diffs, bump_models_version, compose_layers,
+    get_models_connection, ingest_stage, list_models, mesh_stats, models_version, read_layer
+)
+from ifc_query.util.mesh import MeshInterner
+from ifc_query.util.results import (
+    EXPORT_TIMEOUT, MAX_EXPORT_ROWS, PREVIEW_ROWS, QUERY_TIMEOUT, QueryTimeoutError,
+    count_rows, explain, export_csv, export_parquet, full_scans, preview
+)
+from ifc_query.util.logs import st_log
 
-require_auth(lambda : st.markdown("## Please return to the main page to login."))
+load_dotenv()
+
+cookies = EncryptedCookieManager(
+    prefix="ifc_query/",
+    password=os.getenv('COOKIE_PASSWORD', 'default-secret-key')
+)
+
+if not cookies.ready():
+    # Wait for the component to load and send us current cookies.
+    st.stop()
+
+require_auth(cookies, lambda : st.markdown("## Please return to the main page to login."))
 
 st.title("Query Database")
 
+def _ingested_at(model: str):
+    conn = get_models_connection()
+    try:
+        row = conn.execute('SELECT ingested_at FROM models WHERE name = ?', (model,)).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+def load_model(uploaded_files, model: str, geometry: bool):
+    """
+    Load the uploaded layers into a model.
+
+    The stage of the last model loaded in the session is kept, and when the
+    same model is loaded again with some layers added or removed, only the
+    rows they change are applied to its tables (see ingest.apply_diffs). Any
+    other load, or a model replaced since by another session, is ingested
+    from scratch.
+
+    Returns:
+        Number of rows loaded, or None if the model was updated in place
+    """
+    file_ids = [uploaded_file.file_id for uploaded_file in uploaded_files]
+    loaded = st.session_state.get('query_stage')
+    if (loaded is not None and loaded['model'] == model and loaded['geometry'] == geometry
+            and loaded['ingested_at'] == _ingested_at(model)):
+        stage, layer_ids = loaded['stage'], loaded['layer_ids']
+        try:
+            diffs = []
+            for file_id in [file_id for file_id in layer_ids if file_id not in file_ids]:
+                diffs.append(stage.remove_layer(layer_ids.pop(file_id)))
+            for index, uploaded_file in enumerate(uploaded_files):
+                if uploaded_file.file_id not in layer_ids:
+                    layer = read_layer(uploaded_file, geometry, loaded['meshes'])
+                    diffs.append(stage.add_layer(layer, layer_id=uploaded_file.file_id, index=index))
+                    layer_ids[uploaded_file.file_id] = uploaded_file.file_id
+            if diffs:
+                conn = get_models_connection()
+                try:
+                    apply_diffs(conn, model, diffs, compute_geometry(stage) if geometry else None)
+                finally:
+                    conn.close()
+        except Exception:
+            # The stage may no longer match the tables
+            st.session_state.pop('query_stage', None)
+            raise
+        loaded['ingested_at'] = _ingested_at(model)
+        return None
+
+    # Dropped first, so a failed load does not leave a stage that disagrees with the tables
+    st.session_state.pop('query_stage', None)
+    # Layers are parsed in parallel, one process per file up to the number of CPUs
+    progress_bar = st.progress(0.0, text="Parsing layers...")
+    def report(done, total, name):
+        progress_bar.progress(done / total, text=f"Parsed {name} ({done}/{total})")
+    meshes = MeshInterner() if geometry else None
+    stage = compose_layers(uploaded_files, max_workers=None, progress=report, geometry=geometry, meshes=meshes)
+    progress_bar.empty()
+    n_rows = ingest_stage(stage, model, geometry=geometry)
+    st.session_state.query_stage = {
+        'model': model,
+        'geometry': geometry,
+        'stage': stage,
+        'meshes': meshes,
+        # Stage layer ids by upload file id
+        'layer_ids': dict(zip(file_ids, stage.layer_ids)),
+        'ingested_at': _ingested_at(model),
+    }
+    return n_rows
+
+
+# Load IFCX models into the database
+with st.expander("Load a model"):
+    uploaded_files = st.file_uploader("IFCX layers, base model first", type=['ifcx'], accept_multiple_files=True)
+    model_name = st.text_input(
+        "Model name",
+        value=uploaded_files[0].name.rsplit('.', 1)[0] if uploaded_files else ""
+    )
+    with_geometry = st.checkbox(
+        "Compute world transforms and bounding boxes",
+        help="Adds 'world:xform' and 'world:bbox' rows for every prim, keyed by prim path. "
+             "Meshes have to be parsed, so loading is slower."
+    )
+    if st.button("Load model", disabled=not uploaded_files or not model_name):
+        try:
+            with st.spinner("Loading model..."):
+                n_rows = load_model(uploaded_files, model_name, with_geometry)
+            if n_rows is None:
+                st.success(f"Updated model '{model_name}' with the added and removed layers")
+            else:
+                st.success(f"Loaded {n_rows} properties into model '{model_name}'")
+            if with_geometry:
+                conn = get_models_connection()
+                instances, geometries = mesh_stats(conn, model_name) or (0, 0)
+                conn.close()
+                if geometries:
+                    st.caption(f"{instances} meshes stored as {geometries} unique geometries "
+                               f"(dedup ratio {instances / geometries:.1f}x)")
+        except Exception as e:
+            st.error(f"Error loading model: {str(e)}")
+
+conn = get_models_connection()
+models = pd.DataFrame(list_models(conn), columns=['model', 'table', 'rows', 'ingested_at'])
+conn.close()
+if models.empty:
+    st.info("No models loaded yet")
+else:
+    st.write(
+        "Each model is a table with columns (id, property, value). Its `_leaves` table "
+        "(id, property, json_path, num_value, str_value) indexes every scalar inside the values, "
+        "e.g. `WHERE property = 'xformOp' AND json_path = '$.transform[3][0]' AND num_value > 5`. "
+        f"Only the first {MAX_LEAVES_PER_VALUE} leaves of a value are indexed; larger values have a row with "
+        f"json_path `{TRUNCATED_JSON_PATH}`, so filter those with `json_extract(value, path)` on the model table. "
+        "Models loaded with world transforms also have `world:bbox` rows, "
+        "e.g. `WHERE property = 'world:bbox' AND json_path = '$.min[2]' AND num_value >= 3`, "
+        "and an `_rtree` table (id, min_x, max_x, min_y, max_y, min_z, max_z, path) of those boxes for "
+        "spatial filters: `WHERE min_x <= 2 AND max_x >= 0 AND ...` for a box, a self-join on the same "
+        "conditions for clashes, and `bbox_distance(min_x, min_y, min_z, max_x, max_y, max_z, x, y, z)` "
+        "for radius and nearest queries. Their meshes are in `_geometries` (one row per unique mesh) "
+        "and `_instances` (path, geometry_id, transform)."
+    )
+    st.dataframe(models, hide_index=True)
+
 # Query input
 query = st.text_area("Enter your SQL query:", height=150)
 
@@ -16,27 +164,89 @@ if st.button("Execute Query"):
         st.warning("Please enter a query")
         st.stop()
         
+    # Every query is timed and logged with its plan, for the slow-query log on the Admin page
+    record = {'query': query}
+    start = time.perf_counter()
     try:
-        # Execute query
-        conn = get_db_connection()
-        df = pd.read_sql_query(query, conn)
-        conn.close()
-        
-        if len(df) == 0:
-            st.info("Query returned no results")
+        # Repeat queries against unchanged models are answered from the cache
+        key = query_key(query, models_version(), PREVIEW_ROWS)
+        result = QUERY_CACHE.get(key)
+        if result is not None:
+            record.update(duration_ms=(time.perf_counter() - start) * 1000, cached=True)
         else:
-            # Display results
-            st.write("Query Results:")
-            st.dataframe(df)
-            
-            # Add download button
-            csv = df.to_csv(index=False)
-            st.download_button(
-                label="Download results as CSV",
-                data=csv,
-                file_name="query_results.csv",
-                mime="text/csv"
-            )
-            
+            # Only fetch a preview, the full result is streamed on export
+            conn = get_models_connection()
+            try:
+                # Explained up front, so queries that fail or time out have a plan too
+                record['plan'] = explain(conn, query)
+                record['full_scans'] = full_scans(record['plan'])
+                start = time.perf_counter()
+                columns, rows, truncated = preview(conn, query)
+                n_rows = count_rows(conn, query) if truncated else len(rows)
+                record['duration_ms'] = (time.perf_counter() - start) * 1000
+                if not columns and not conn.in_transaction:
+                    # DDL commits as it runs (DML is rolled back on close), so
+                    # previews cached before it may be stale
+                    with conn:
+                        bump_models_version(conn)
+            finally:
+                conn.close()
+            result = pd.DataFrame.from_records(rows, columns=columns)
+            result.attrs.update(truncated=truncated, rows=n_rows)
+            # Statements that return no columns (DDL, DML) are not worth caching
+            if columns:
+                QUERY_CACHE.put(key, result)
+        record.update(rows=result.attrs['rows'], truncated=result.attrs['truncated'])
+        st.session_state.query_result = (query, result)
+        st.session_state.pop('query_export', None)
+    except QueryTimeoutError:
+        record.update(duration_ms=(time.perf_counter() - start) * 1000, error='timeout')
+        st.error(f"Query took longer than {QUERY_TIMEOUT:g}s and was interrupted")
+        st.session_state.pop('query_result', None)
     except Exception as e:
+        record.update(duration_ms=(time.perf_counter() - start) * 1000, error=str(e))
         st.error(f"Error executing query: {str(e)}")
+        st.session_state.pop('query_result', None)
+    st_log('query', record)
+
+if 'query_result' in st.session_state:
+    last_query, result = st.session_state.query_result
+    truncated, n_rows = result.attrs['truncated'], result.attrs['rows']
+    if len(result) == 0:
+        st.info("Query returned no results")
+    else:
+        # Display results
+        st.write("Query Results:")
+        if truncated:
+            total = f"{n_rows} rows" if n_rows is not None else "more rows"
+            st.caption(f"Showing the first {len(result)} of {total}")
+        st.dataframe(result)
+
+        # Exports stream the full result (up to MAX_EXPORT_ROWS) in batches
+        if truncated and (n_rows is None or n_rows > MAX_EXPORT_ROWS):
+            st.warning(f"Exports are limited to the first {MAX_EXPORT_ROWS} rows")
+        export_format = st.radio("Export format", ["CSV", "Parquet"], horizontal=True)
+        if st.button("Prepare export"):
+            try:
+                conn = get_models_connection()
+                try:
+                    with st.spinner("Exporting..."):
+                        export = export_csv if export_format == "CSV" else export_parquet
+                        st.session_state.query_export = (export_format, export(conn, last_query))
+                finally:
+                    conn.close()
+            except QueryTimeoutError:
+                st.error(f"Export took longer than {EXPORT_TIMEOUT:g}s and was interrupted")
+            except Exception as e:
+                st.error(f"Error exporting results: {str(e)}")
+
+        if 'query_export' in st.session_state:
+            export_format, data = st.session_state.query_export
+            data.seek(0)
+            # Add download button; Streamlit takes bytes, not spooled files
+            st.download_button(
+                label=f"Download results as {export_format}",
+                data=data.read(),
+                file_name="query_results.csv" if export_format == "CSV" else "query_results.parquet",
+                mime="text/csv" if export_format == "CSV" else "application/vnd.apache.parquet"
+            )
@@ -1,26 +1,50 @@
 import streamlit as st
-import requests
 import os
 from dotenv import load_dotenv
+from datetime import datetime
 from typing import Optional, Callable
 from ifc_query.util.db import (
     add_user, get_session, delete_session
 )
+from ifc_query.util.session_cache import SESSIONS, USERS, fetch_user
 
 load_dotenv()
 
-# Initialize cookie manager
-
-@st.cache_data(ttl=15*60) # check with the auth server every 15 minutes
-def get_user_data(access_token):
-    headers = {'Authorization': f'token {access_token}'}
-    response = requests.get('https://api.github.com/user', headers=headers)
-    user_data = response.json()
+def _load_user_data(access_token):
+    user_data = fetch_user(access_token)
     if user_data:
         # Store user data in database
         add_user(user_data["login"], user_data["name"])
     return user_data
 
+def get_user_data(access_token) -> Optional[dict]:
+    """
+    User data for an access token, None if the auth server rejects the token.
+
+    Cached for all sessions of the server process, and rechecked with the
+    auth server every 15 minutes.
+    """
+    return USERS.get_or_load(access_token, lambda: _load_user_data(access_token))
+
+def _session_expired(session: dict) -> bool:
+    expires_at = session['expires_at']
+    if isinstance(expires_at, str):
+        expires_at = datetime.fromisoformat(expires_at)
+    return expires_at <= datetime.now()
+
+def get_cached_session(session_id) -> Optional[dict]:
+    """
+    Like db.get_session, but served from the process-wide session cache.
+
+    A cached session is dropped as soon as it reaches its expires_at, even
+    if it has time left in the cache.
+    """
+    session = SESSIONS.get_or_load(session_id, lambda: get_session(session_id))
+    if session is not None and _session_expired(session):
+        SESSIONS.pop(session_id)
+        return None
+    return session
+
 def require_auth(cookies, callback: Optional[Callable] = None) -> None:
     """
     Checks if user is authenticated and sets up session data.
@@ -34,15 +58,14 @@ def require_auth(cookies, callback: Optional[Callable] = None) -> None:
         # Check for session cookie
         session_id = cookies.get('session_id', None)
         if session_id:
-            session = get_session(session_id)
+            session = get_cached_session(session_id)
             if session:
                 st.session_state.access_token = session['access_token']
                 # Fetch user data if not present
                 if 'user_data' not in st.session_state or not st.session_state.user_data:
-                    headers = {'Authorization': f'token {session["access_token"]}'}
-                    response = requests.get('https://api.github.com/user', headers=headers)
-                    if response.status_code == 200:
-                        st.session_state.user_data = response.json()
+                    user_data = get_user_data(session['access_token'])
+                    if user_data:
+                        st.session_state.user_data = user_data
                     else:
                         # Token might be invalid
                         delete_session(session_id)
@@ -63,14 +86,13 @@ def require_auth(cookies, callback: Optional[Callable] = None) -> None:
     # We have an access token in session state
     if 'user_data' not in st.session_state or not st.session_state.user_data:
         # Fetch user data
-        headers = {'Authorization': f'token {st.session_state.access_token}'}
-        response = requests.get('https://api.github.com/user', headers=headers)
-        if response.status_code == 200:
-            st.session_state.user_data = response.json()
+        user_data = get_user_data(st.session_state.access_token)
+        if user_data:
+            st.session_state.user_data = user_data
         else:
             # Token is invalid
             st.session_state.access_token = None
             st.session_state.user_data = None
             if callback:
                 callback()
-            st.stop() 
\ No newline at end of file
+            st.stop()
@@ -0,0 +1,116 @@
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from logging import log, INFO
+from pathlib import Path
+from typing import Callable, Collection, List, Optional, Sequence, Union
+
+import pandas as pd
+
+from ifc_query.util.compose import Stage, iter_stage_rows
+from ifc_query.util.ifc import IGNORE_ATTRS, PropertyColumns
+from ifc_query.util.mesh import MESH_ATTR, MeshInterner
+from ifc_query.util.stream import iter_objects
+
+# A path to an IFCX file, or an open binary file such as a Streamlit upload
+Source = Union[str, Path, io.IOBase]
+
+# Called as each file is parsed with (files done, total files, name of the file)
+Progress = Callable[[int, int, str], None]
+
+
+def _source_name(source: Source) -> str:
+    if isinstance(source, (str, Path)):
+        return os.path.basename(source)
+    return getattr(source, 'name', None) or 'upload'
+
+
+def _picklable(source: Source) -> Union[str, bytes]:
+    """Paths are reopened by the worker, open files are sent as their contents"""
+    if isinstance(source, (str, Path)):
+        return str(source)
+    if isinstance(source, io.BytesIO):
+        return source.getvalue()
+    source.seek(0)
+    return source.read()
+
+
+def _read_objects(f, skip_attributes: Collection[str]) -> List[dict]:
+    objects = iter_objects(f, skip_attributes=skip_attributes)
+    if MESH_ATTR not in skip_attributes:
+        objects = MeshInterner().intern_objects(objects)
+    return list(objects)
+
+
+def parse_layer(source: Union[str, bytes], skip_attributes: Collection[str] = IGNORE_ATTRS) -> List[dict]:
+    """
+    Parse the objects of one IFCX file, without the attributes in skip_attributes.
+
+    Runs in the worker processes, where skipping the heavy mesh attributes
+    also means they are never sent back to the parent. When meshes are kept,
+    identical ones are interned, so they are held and sent back only once.
+    """
+    with io.BytesIO(source) if isinstance(source, bytes) else open(source, 'rb') as f:
+        return _read_objects(f, skip_attributes)
+
+
+def parse_layers(sources: Sequence[Source], max_workers: Optional[int] = None,
+                 progress: Optional[Progress] = None,
+                 skip_attributes: Collection[str] = IGNORE_ATTRS) -> List[List[dict]]:
+    """
+    Parse IFCX files in parallel, one file per task in a process pool.
+
+    Args:
+        sources: Paths or open binary files
+        max_workers: Number of processes, defaults to the number of CPUs; with
+            one worker or one file, parsing happens in this process
+        progress: Called on this thread as each file finishes, in completion order
+        skip_attributes: Attributes dropped while parsing, defaults to IGNORE_ATTRS
+
+    Returns:
+        The objects of each file, in the order the files were given
+    """
+    sources = list(sources)
+    max_workers = min(max_workers or os.cpu_count() or 1, len(sources)) if sources else 1
+    layers: List[Optional[List[dict]]] = [None] * len(sources)
+
+    if max_workers <= 1:
+        for i, source in enumerate(sources):
+            if isinstance(source, (str, Path)):
+                layers[i] = parse_layer(str(source), skip_attributes)
+            else:
+                layers[i] = _read_objects(source, skip_attributes)
+            if progress:
+                progress(i + 1, len(sources), _source_name(source))
+        return layers
+
+    # spawn rather than fork: the Streamlit server is multi-threaded, and
+    # forking it can deadlock the children on locks held by other threads
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        futures = {executor.submit(parse_layer, _picklable(source), tuple(skip_attributes)): i for i, source in enumerate(sources)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            layers[i] = future.result()
+            if progress:
+                progress(done, len(sources), _source_name(sources[i]))
+    log(INFO, f"Parsed {len(sources)} IFCX files with {max_workers} processes")
+    return layers
+
+
+def batch_layers_to_df(sources: Sequence[Source], max_workers: Optional[int] = None,
+                       progress: Optional[Progress] = None, dtype_backend: str = 'numpy') -> pd.DataFrame:
+    """
+    Like ifcx_layers_to_df, with the files parsed in parallel.
+
+    The layers are composed in the order given (base model first) once all
+    of them are parsed, and the composed properties are merged into one table.
+
+    Returns:
+        DataFrame with columns ['id', 'property', 'value']
+    """
+    stage = Stage(parse_layers(sources, max_workers, progress))
+    columns = PropertyColumns()
+    columns.extend(iter_stage_rows(stage))
+    return columns.to_df(dtype_backend)
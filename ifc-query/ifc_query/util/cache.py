@@ -0,0 +1,207 @@
+import hashlib
+import io
+import os
+import re
+import threading
+from collections import OrderedDict
+from logging import log, INFO, WARN
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+import pandas as pd
+
+from ifc_query.util.db import DB_FOLDER
+from ifc_query.util.ifc import PARSER_VERSION, ifcx_layers_to_df, ifcx_to_df
+
+CACHE_FOLDER = DB_FOLDER / Path('cache')
+
+# Digests of Streamlit uploads by file_id, which is unique per upload, so a
+# rerun does not hash the same bytes again; least recently used first
+MAX_UPLOAD_DIGESTS = 1024
+_upload_digests: OrderedDict = OrderedDict()
+_upload_digests_lock = threading.Lock()
+
+
+def file_digest(ifcx_file: io.BytesIO) -> str:
+    """
+    Hash the contents of an IFCX file, leaving its position unchanged.
+
+    Args:
+        ifcx_file: A BytesIO object (or Streamlit UploadedFile) with the IFCX contents
+
+    Returns:
+        Hex digest of the file contents
+    """
+    file_id = getattr(ifcx_file, 'file_id', None)
+    if file_id is not None:
+        with _upload_digests_lock:
+            if file_id in _upload_digests:
+                _upload_digests.move_to_end(file_id)
+                return _upload_digests[file_id]
+
+    if isinstance(ifcx_file, io.BytesIO):
+        digest = hashlib.blake2b(ifcx_file.getbuffer(), digest_size=20).hexdigest()
+    else:
+        position = ifcx_file.tell()
+        ifcx_file.seek(0)
+        digest = hashlib.file_digest(ifcx_file, lambda: hashlib.blake2b(digest_size=20)).hexdigest()
+        ifcx_file.seek(position)
+
+    if file_id is not None:
+        with _upload_digests_lock:
+            _upload_digests[file_id] = digest
+            while len(_upload_digests) > MAX_UPLOAD_DIGESTS:
+                _upload_digests.popitem(last=False)
+    return digest
+
+
+class TableCache:
+    """
+    Content-addressed cache of flattened property tables.
+
+    Tables are stored as Parquet files under a cache folder, so they survive
+    restarts and are shared between server processes, with an in-process LRU
+    in front. Both levels are bounded by size: the LRU by the memory the
+    DataFrames hold, the folder by bytes on disk, evicting the least recently
+    used entries first. Cached DataFrames are shared and must not be mutated.
+    """
+
+    def __init__(self, folder: Path, max_memory: int = 1 << 30, max_disk: int = 8 << 30):
+        self.folder = Path(folder)
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self._entries: OrderedDict = OrderedDict()
+        self._memory = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.folder / f"{key}.parquet"
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        """Look a table up in memory, then on disk"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+
+        path = self._path(key)
+        try:
+            df = pd.read_parquet(path)
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        os.utime(path)
+        self._remember(key, df)
+        return df
+
+    def put(self, key: str, df: pd.DataFrame) -> None:
+        """Store a table in memory and on disk"""
+        os.makedirs(self.folder, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+        except (OSError, ValueError, TypeError) as e:
+            # e.g. mixed types or duplicate names in a column, which Parquet
+            # cannot store; the table is still cached in memory
+            log(WARN, f"Could not write cached table {path}: {e}")
+            Path(tmp_path).unlink(missing_ok=True)
+        self._remember(key, df)
+        self._evict_disk()
+
+    def get_or_build(self, key: str, build: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        df = self.get(key)
+        if df is None:
+            df = build()
+            self.put(key, df)
+        return df
+
+    def _remember(self, key: str, df: pd.DataFrame) -> None:
+        size = int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            if key in self._entries:
+                self._memory -= self._entries.pop(key)[1]
+            if size > self.max_memory:
+                return
+            self._entries[key] = (df, size)
+            self._memory += size
+            while self._memory > self.max_memory:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._memory -= evicted
+
+    def _evict_disk(self) -> None:
+        try:
+            files = [(entry.stat().st_mtime, entry.stat().st_size, entry) for entry in self.folder.glob('*.parquet')]
+        except OSError:
+            return
+        total = sum(size for _, size, _ in files)
+        for _, size, entry in sorted(files, key=lambda f: f[0]):
+            if total <= self.max_disk:
+                break
+            try:
+                entry.unlink()
+                total -= size
+                log(INFO, f"Evicted cached table {entry.name}")
+            except OSError:
+                pass
+
+    def clear(self) -> None:
+        """Drop every cached table, in memory and on disk"""
+        with self._lock:
+            self._entries.clear()
+            self._memory = 0
+        for entry in self.folder.glob('*.parquet'):
+            entry.unlink(missing_ok=True)
+
+
+TABLE_CACHE = TableCache(CACHE_FOLDER)
+
+# Previews of query results, see query_key
+QUERY_CACHE = TableCache(CACHE_FOLDER / 'queries', max_memory=256 << 20, max_disk=1 << 30)
+
+_SQL_TOKENS = re.compile(r"""
+    (?P<literal>'(?:[^']|'')*'|"(?:[^"]|"")*"|`(?:[^`]|``)*`|\[[^\]]*\])
+  | (?P<comment>--[^\n]*|/\*.*?(?:\*/|$))
+  | (?P<space>\s+)
+  | (?P<other>[^'"`\[\s/;-]+|.)
+""", re.VERBOSE | re.DOTALL)
+
+
+def table_key(kind: str, ifcx_files: Iterable[io.BytesIO]) -> str:
+    """Cache key for a table built from the given files by the current parser"""
+    digests = ':'.join(file_digest(f) for f in ifcx_files)
+    return hashlib.blake2b(f"{kind}:{PARSER_VERSION}:{digests}".encode(), digest_size=20).hexdigest()
+
+
+def cached_ifcx_to_df(ifcx_file: io.BytesIO) -> pd.DataFrame:
+    """ifcx_to_df, reusing the table from the cache if this file was flattened before"""
+    return TABLE_CACHE.get_or_build(table_key('overs', [ifcx_file]), lambda: ifcx_to_df(ifcx_file))
+
+
+def cached_layers_to_df(ifcx_files: Iterable[io.BytesIO]) -> pd.DataFrame:
+    """ifcx_layers_to_df, reusing the table from the cache if these layers were composed before"""
+    ifcx_files = list(ifcx_files)
+    return TABLE_CACHE.get_or_build(table_key('layers', ifcx_files), lambda: ifcx_layers_to_df(ifcx_files))
+
+
+def normalize_sql(query: str) -> str:
+    """
+    Normalize a SQL statement for use as a cache key.
+
+    Comments and whitespace around the statement and trailing semicolons are
+    dropped. Everything in between is kept as written: SQLite names result
+    columns after the text of their expressions, case, spacing and comments
+    included (e.g. 'SELECT x AS Foo' or 'SELECT Count(*)'), so statements
+    differing anywhere inside can return different column names.
+    """
+    tokens = [match for match in _SQL_TOKENS.finditer(query) if match.lastgroup not in ('comment', 'space')]
+    while tokens and tokens[-1].group() == ';':
+        tokens.pop()
+    if not tokens:
+        return ''
+    return query[tokens[0].start():tokens[-1].end()]
+
+
+def query_key(query: str, version: int, n_rows: int) -> str:
+    """Cache key for the first n_rows of a query against one version of the models database"""
+    return hashlib.blake2b(f"query:{version}:{n_rows}:{normalize_sql(query)}".encode(), digest_size=20).hexdigest()
@@ -0,0 +1,315 @@
+import itertools
+import json
+from dataclasses import dataclass, field
+from logging import log, WARN
+from typing import Collection, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# A layer is the parsed top-level array of one IFCX file
+Layer = Iterable[dict]
+
+
+@dataclass
+class PrimSpec:
+    """The opinions all layers hold about one prim, strongest applied last"""
+    name: str
+    specifier: str = 'over'
+    type: Optional[str] = None
+    inherits: List[str] = field(default_factory=list)
+    attributes: Dict[str, object] = field(default_factory=dict)
+    children: Dict[str, 'PrimSpec'] = field(default_factory=dict)
+
+    def apply(self, obj: dict) -> None:
+        """Layer the opinions of an IFCX object over this spec"""
+        if obj.get('def') in ('def', 'class') and self.specifier != 'def':
+            self.specifier = obj['def']
+        if obj.get('type'):
+            self.type = obj['type']
+        for ref in obj.get('inherits', ()):
+            target = inherits_target(ref)
+            if target not in self.inherits:
+                self.inherits.append(target)
+        self.attributes.update(obj.get('attributes', {}))
+        for child in obj.get('children', ()):
+            name = child.get('name')
+            if name is None:
+                continue
+            if name not in self.children:
+                self.children[name] = PrimSpec(name)
+            self.children[name].apply(child)
+
+
+@dataclass
+class Prim:
+    """
+    A composed prim: its own opinions layered over those of everything it
+    inherits. Prims and their attribute and children dicts are shared between
+    instances of the same class, so they must be treated as read-only.
+    """
+    name: str
+    specifier: str
+    type: Optional[str]
+    inherits: Tuple[str, ...]
+    attributes: Dict[str, object]
+    children: Dict[str, 'Prim']
+
+
+def inherits_target(ref: str) -> str:
+    """Name of the object referenced by an inherits entry such as '</N1234>'"""
+    return ref.strip().removeprefix('<').removesuffix('>').lstrip('/')
+
+
+@dataclass
+class StageDiff:
+    """Changes to the flattened (id, property, value) rows of a stage"""
+    upserts: List[Tuple[str, str, str]] = field(default_factory=list)
+    deletes: List[Tuple[str, str]] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.upserts or self.deletes)
+
+
+def _references(spec: PrimSpec) -> Set[str]:
+    """Every name a spec's composition depends on, including through its children"""
+    targets = set(spec.inherits)
+    for child in spec.children.values():
+        targets |= _references(child)
+    return targets
+
+
+class Stage:
+    """
+    The composition of an ordered stack of IFCX layers.
+
+    Layers are given weakest first, so that later layers (e.g. an overlay
+    such as hello-wall-add-window.ifcx on top of hello-wall.ifcx) override
+    earlier ones. Every def, class and over is merged into one PrimSpec per
+    name as the layers are read; prims are then composed on demand, and each
+    composed name is cached so an inherited class is resolved once no matter
+    how many instances inherit from it.
+
+    The stage remembers which names each layer touches and which names
+    inherit from which, so adding or removing a layer only recomposes the
+    touched prims and their inheritors, and reports the rows that changed.
+    The initial layers can be given layer_ids for remove_layer, as add_layer
+    does; they default to a counter.
+    """
+
+    def __init__(self, layers: Iterable[Layer] = (), layer_ids: Optional[Iterable[str]] = None):
+        self.specs: Dict[str, PrimSpec] = {}
+        self.layer_ids: List[str] = []
+        self._opinions: Dict[str, List[Tuple[str, dict]]] = {}
+        self._touched: Dict[str, Set[str]] = {}
+        self._dependents: Dict[str, Set[str]] = {}
+        self._composed: Dict[str, Prim] = {}
+        self._composing: set = set()
+        self._layer_count = itertools.count()
+        layer_ids = iter(layer_ids) if layer_ids is not None else (str(i) for i in self._layer_count)
+        for layer, layer_id in zip(layers, layer_ids):
+            self._insert_layer(layer, layer_id, len(self.layer_ids))
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.specs
+
+    def add_layer(self, layer: Layer, layer_id: Optional[str] = None, index: Optional[int] = None) -> StageDiff:
+        """
+        Add a layer to the stage and recompose the prims it affects.
+
+        Args:
+            layer: The objects of an IFCX file
+            layer_id: Identifier used to remove the layer later, defaults to a counter
+            index: Position in the layer stack, defaults to the top (strongest)
+
+        Returns:
+            The changes to the flattened rows of the stage
+        """
+        layer_id = str(next(self._layer_count)) if layer_id is None else layer_id
+        if layer_id in self._touched:
+            raise ValueError(f"Layer {layer_id} is already on the stage")
+        index = len(self.layer_ids) if index is None else index
+        objects = [obj for obj in layer if isinstance(obj, dict) and obj.get('name') is not None]
+        touched = {obj['name'] for obj in objects}
+        return self._update(touched, lambda: self._insert_layer(objects, layer_id, index))
+
+    def remove_layer(self, layer_id: str) -> StageDiff:
+        """Remove a layer from the stage and recompose the prims it affected"""
+        if layer_id not in self._touched:
+            raise KeyError(f"Layer {layer_id} is not on the stage")
+        return self._update(self._touched[layer_id], lambda: self._remove_layer(layer_id))
+
+    def _insert_layer(self, layer: Layer, layer_id: str, index: int) -> None:
+        on_top = index >= len(self.layer_ids)
+        self.layer_ids.insert(index, layer_id)
+        touched = self._touched[layer_id] = set()
+        for obj in layer:
+            if not isinstance(obj, dict) or obj.get('name') is None:
+                continue
+            name = obj['name']
+            touched.add(name)
+            self._opinions.setdefault(name, []).append((layer_id, obj))
+            if on_top:
+                # The strongest layer can simply be applied over the merged spec
+                if name not in self.specs:
+                    self.specs[name] = PrimSpec(name)
+                self.specs[name].apply(obj)
+        if on_top:
+            # Applying opinions only ever adds inherits, so no links go stale
+            for name in touched:
+                self._link(name)
+        else:
+            self._rebuild(touched)
+
+    def _remove_layer(self, layer_id: str) -> None:
+        self.layer_ids.remove(layer_id)
+        touched = self._touched.pop(layer_id)
+        for name in touched:
+            self._opinions[name] = [(lid, obj) for lid, obj in self._opinions[name] if lid != layer_id]
+        self._rebuild(touched)
+
+    def _rebuild(self, names: Iterable[str]) -> None:
+        """Re-merge the specs of names from the opinions of every layer, in stack order"""
+        order = {layer_id: i for i, layer_id in enumerate(self.layer_ids)}
+        for name in names:
+            self._unlink(name)
+            opinions = sorted(self._opinions.get(name, ()), key=lambda opinion: order[opinion[0]])
+            if not opinions:
+                self.specs.pop(name, None)
+                self._opinions.pop(name, None)
+                continue
+            spec = self.specs[name] = PrimSpec(name)
+            for _, obj in opinions:
+                spec.apply(obj)
+            self._link(name)
+
+    def _link(self, name: str) -> None:
+        for target in _references(self.specs[name]):
+            self._dependents.setdefault(target, set()).add(name)
+
+    def _unlink(self, name: str) -> None:
+        if name in self.specs:
+            for target in _references(self.specs[name]):
+                self._dependents.get(target, set()).discard(name)
+
+    def _affected(self, names: Iterable[str]) -> Set[str]:
+        """The given names and, transitively, every name that inherits from them"""
+        affected = set()
+        pending = list(names)
+        while pending:
+            name = pending.pop()
+            if name not in affected:
+                affected.add(name)
+                pending.extend(self._dependents.get(name, ()))
+        return affected
+
+    def _update(self, touched: Set[str], change) -> StageDiff:
+        # Inheritors are collected both before and after the change, since it
+        # can add or remove inherits edges
+        affected = self._affected(touched)
+        before = {name: self.prim(name).attributes for name in affected if name in self.specs}
+        change()
+        affected |= self._affected(touched)
+        for name in affected:
+            self._composed.pop(name, None)
+
+        diff = StageDiff()
+        for name in affected:
+            old = before.get(name, {})
+            new = self.prim(name).attributes if name in self.specs else {}
+            for prop, value in new.items():
+                if prop not in old or old[prop] != value:
+                    diff.upserts.append((name, prop, json.dumps(value)))
+            diff.deletes.extend((name, prop) for prop in old if prop not in new)
+        return diff
+
+    def prim(self, name: str) -> Prim:
+        """The composed prim for a top-level name"""
+        prim = self._composed.get(name)
+        if prim is None:
+            self._composing.add(name)
+            try:
+                prim = self._compose(self.specs[name])
+            finally:
+                self._composing.discard(name)
+            self._composed[name] = prim
+        return prim
+
+    def _bases(self, spec: PrimSpec) -> List[Prim]:
+        bases = []
+        for target in spec.inherits:
+            if target in self._composing:
+                log(WARN, f"Ignoring cyclic inherits from {spec.name} to {target}")
+            elif target in self.specs:
+                bases.append(self.prim(target))
+        return bases
+
+    def _compose(self, spec: PrimSpec, inherited: Optional[Prim] = None) -> Prim:
+        # Earlier inherits are stronger, and anything inherited through the
+        # parent (a child of the same name on an inherited class) is weakest
+        bases = self._bases(spec)
+        if inherited is not None:
+            bases.append(inherited)
+
+        if len(bases) == 1 and not spec.attributes and not spec.children and spec.type in (None, bases[0].type):
+            base = bases[0]
+            return Prim(spec.name, spec.specifier, base.type, tuple(spec.inherits), base.attributes, base.children)
+
+        prim_type = spec.type
+        attributes: Dict[str, object] = {}
+        children: Dict[str, Prim] = {}
+        for base in reversed(bases):
+            prim_type = spec.type or base.type or prim_type
+            attributes.update(base.attributes)
+            children.update(base.children)
+        attributes.update(spec.attributes)
+        for name, child in spec.children.items():
+            children[name] = self._compose(child, children.get(name))
+
+        return Prim(spec.name, spec.specifier, prim_type, tuple(spec.inherits), attributes, children)
+
+    def root_names(self) -> List[str]:
+        """Names of the top-level defs, the roots of the prim tree"""
+        return [name for name, spec in self.specs.items() if spec.specifier == 'def']
+
+    def iter_prims(self) -> Iterator[Tuple[str, Prim]]:
+        """Walk the composed prim tree depth first, yielding (path, prim)"""
+        stack = [(f"/{name}", self.prim(name)) for name in reversed(self.root_names())]
+        while stack:
+            path, prim = stack.pop()
+            yield path, prim
+            stack.extend((f"{path}/{name}", child) for name, child in reversed(prim.children.items()))
+
+
+def iter_stage_rows(stage: Stage, ignore_attrs: Collection[str] = ()) -> Iterator[Tuple[str, str, str]]:
+    """
+    Flatten the composed attributes of every named object on a stage.
+
+    Rows are keyed by the top-level name, which is what an "over" in an edit
+    layer targets, and carry the composed value: inherited attributes
+    included, with the strongest layer's opinion winning.
+
+    Args:
+        stage: The composed stage
+        ignore_attrs: Attribute names to leave out
+
+    Yields:
+        (id, property, value) tuples, with value JSON-encoded
+    """
+    for name in stage.specs:
+        for prop, value in stage.prim(name).attributes.items():
+            if prop not in ignore_attrs:
+                yield name, prop, json.dumps(value)
+
+
+def iter_prim_rows(stage: Stage, ignore_attrs: Collection[str] = ()) -> Iterator[Tuple[str, str, str]]:
+    """
+    Flatten the composed attributes of every prim in the stage's prim tree.
+
+    Like iter_stage_rows, but keyed by prim path (e.g. /My_Project/My_Site),
+    so each instance of a class gets its own rows.
+
+    Yields:
+        (path, property, value) tuples, with value JSON-encoded
+    """
+    for path, prim in stage.iter_prims():
+        for prop, value in prim.attributes.items():
+            if prop not in ignore_attrs:
+                yield path, prop, json.dumps(value)
@@ -4,136 +4,262 @@ import importlib
 import glob
 from pathlib import Path
 from logging import log, INFO, DEBUG, WARN, ERROR
+import queue
+import threading
 import uuid
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Iterator, Optional
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where BEGIN IMMEDIATE alone serializes migrations
+    fcntl = None
+from ifc_query.util.session_cache import invalidate_session
 DB_FOLDER = "ifc_query/data"
 DB_PATH = DB_FOLDER / Path("info.db")
 
-def get_current_schema_version():
+# Connections are shared between Streamlit's script threads, which are
+# short-lived (one per rerun), so a small pool is used rather than one
+# connection per thread
+POOL_SIZE = 8
+POOL_TIMEOUT = 30.0
+BUSY_TIMEOUT = 5.0
+CACHED_STATEMENTS = 128
+
+PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-8000',
+]
+
+class ConnectionPool:
+    """
+    A bounded pool of long-lived connections to one SQLite database.
+
+    Each connection is set up once (WAL, pragmas) and keeps sqlite3's cache
+    of prepared statements, so repeated lookups skip both the open and the
+    parse. A connection is only ever used by one thread at a time.
+    """
+
+    def __init__(self, path, max_size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT):
+        self.path = path
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(
+            self.path, timeout=BUSY_TIMEOUT, check_same_thread=False, cached_statements=CACHED_STATEMENTS
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            grow = self._size < self.max_size
+            if grow:
+                self._size += 1
+        if grow:
+            try:
+                return self._connect()
+            except BaseException:
+                with self._lock:
+                    self._size -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(f"No database connection available after {self.timeout}s")
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection, anything left uncommitted is rolled back when it is returned"""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+            finally:
+                self._idle.put(conn)
+
+    def close(self) -> None:
+        """Close the idle connections, borrowed ones are closed when the pool is garbage collected"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._size -= 1
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def connection(path=None):
+    """
+    Borrow a pooled connection to a database, DB_PATH by default.
+
+    Usage:
+        with connection() as conn:
+            conn.execute(...)
+    """
+    path = str(DB_PATH if path is None else path)
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(path, ConnectionPool(path))
+    return pool.connection()
+
+def get_current_schema_version(conn: Optional[sqlite3.Connection] = None):
     """Get the current schema version from the database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
+    if conn is None:
+        with connection() as conn:
+            return get_current_schema_version(conn)
     try:
-        cursor.execute('SELECT version FROM schema_version ORDER BY version DESC LIMIT 1')
-        version = cursor.fetchone()
+        version = conn.execute('SELECT version FROM schema_version ORDER BY version DESC LIMIT 1').fetchone()
         return version[0] if version else 0
     except sqlite3.OperationalError:
         # Table doesn't exist yet
         return 0
-    finally:
-        conn.close()
 
-def apply_migrations(current_version):
-    """Apply all necessary migrations in order"""
-    migrations_path = Path(__file__).parent / 'migrations'
+def find_migrations():
+    """(from_version, to_version, module_path) of every migration, sorted by from_version"""
+    migrations_path = Path(__file__).parent.parent / 'migrations'
     migration_files = glob.glob(str(migrations_path / 'migration_*_*.py'))
-    log(INFO, f"Migrations found: {migration_files}")
-    
+    log(DEBUG, f"Migrations found: {migration_files}")
+
     # Parse migration files to get from and to versions
     migrations = []
     for file in migration_files:
         filename = os.path.basename(file)
         from_ver, to_ver = map(int, filename.replace('migration_', '').replace('.py', '').split('_'))
-        migrations.append((from_ver, to_ver, file))
-    
+        migrations.append((from_ver, to_ver, f"ifc_query.migrations.migration_{from_ver}_{to_ver}"))
+
     # Sort migrations by from_version
     migrations.sort(key=lambda x: x[0])
-    log(INFO, f"Migrataions: {migrations}")
+    return migrations
+
+def apply_migrations(current_version, conn: sqlite3.Connection):
+    """
+    Apply all necessary migrations in order, on conn and inside the caller's
+    transaction, so that either all of them are applied or none are.
 
+    Returns:
+        Number of migrations applied
+    """
     n_migrations_applied = 0
 
     # Apply each needed migration in order
-    for from_ver, to_ver, file_path in migrations:
+    for from_ver, to_ver, module_path in find_migrations():
         if from_ver >= current_version and to_ver > current_version:
             # Import and run the migration
-            module_path = f"ifc_query.migrations.migration_{from_ver}_{to_ver}"
-            log(INFO, f"Attempting migration {module_path}, from {os.getcwd()}")
+            log(INFO, f"Attempting migration {module_path}")
             migration_module = importlib.import_module(module_path)
-            migration_module.migrate()
+            migration_module.migrate(conn)
             n_migrations_applied += 1
 
     return n_migrations_applied
 
+@contextmanager
+def _migration_lock():
+    """An exclusive lock on a file next to the database, held while migrating"""
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    with open(f"{DB_PATH}.migrate.lock", 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+# Schema version verified by ensure_db_exists, per database path, so the
+# check runs once per process rather than on every rerun
+_verified_versions: Dict[str, int] = {}
+_verify_lock = threading.Lock()
+
 def ensure_db_exists():
     """Create the database and tables if they don't exist, and apply any pending migrations"""
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Create users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            login TEXT PRIMARY KEY,
-            name TEXT NOT NULL
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    if str(DB_PATH) in _verified_versions:
+        return
 
-    # Check and apply migrations
-    current_version = get_current_schema_version()
-    log(INFO, f"Database schema version: {current_version}")
-    n = apply_migrations(current_version)
-    log(INFO, f"{n} database migrations applied.")
+    with _verify_lock:
+        if str(DB_PATH) in _verified_versions:
+            return
+        # Other server processes may be starting at the same time: the file
+        # lock lets one of them migrate while the others wait, and they then
+        # find the schema up to date. BEGIN IMMEDIATE covers platforms without
+        # fcntl, and makes the migrations a single transaction.
+        with _migration_lock(), connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            # Create users table
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    login TEXT PRIMARY KEY,
+                    name TEXT NOT NULL
+                )
+            ''')
+
+            # Check and apply migrations
+            current_version = get_current_schema_version(conn)
+            log(INFO, f"Database schema version: {current_version}")
+            n = apply_migrations(current_version, conn)
+            conn.commit()
+            log(INFO, f"{n} database migrations applied.")
+
+            _verified_versions[str(DB_PATH)] = get_current_schema_version(conn)
 
 def add_user(login: str, name: str):
     """Add or update a user in the database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        INSERT OR REPLACE INTO users (login, name)
-        VALUES (?, ?)
-    ''', (login, name))
-    
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO users (login, name)
+            VALUES (?, ?)
+        ''', (login, name))
+        conn.commit()
 
 def get_user(login: str):
     """Retrieve a user from the database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM users WHERE login = ?', (login,))
-    user = cursor.fetchone()
-    
-    conn.close()
-    return user
+    with connection() as conn:
+        return conn.execute('SELECT * FROM users WHERE login = ?', (login,)).fetchone()
 
 def store_session(user_id: str, access_token: str) -> str:
     """Store a session with an encrypted token and return a session ID"""
     session_id = str(uuid.uuid4())
     expiry = datetime.now() + timedelta(days=30)
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
     # TODO: Encrypt token before storage
     query = """
         INSERT INTO sessions (session_id, user_id, access_token, expires_at)
         VALUES (?, ?, ?, ?)
     """
-    cursor.execute(query, (session_id, user_id, access_token, expiry))
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        conn.execute(query, (session_id, user_id, access_token, expiry))
+        conn.commit()
     return session_id
 
 def get_session(session_id: str) -> Optional[dict]:
     """Retrieve and validate a session"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
     query = """
         SELECT user_id, access_token, expires_at 
         FROM sessions 
         WHERE session_id = ? AND expires_at > ?
     """
-    result = cursor.execute(query, (session_id, datetime.now())).fetchone()
-    conn.close()
+    with connection() as conn:
+        result = conn.execute(query, (session_id, datetime.now())).fetchone()
     
     if result:
         return {
@@ -145,10 +271,46 @@ def get_session(session_id: str) -> Optional[dict]:
 
 def delete_session(session_id: str) -> None:
     """Remove a session"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
     query = "DELETE FROM sessions WHERE session_id = ?"
-    cursor.execute(query, (session_id,))
-    conn.commit()
-    conn.close()
\ No newline at end of file
+    with connection() as conn:
+        conn.execute(query, (session_id,))
+        conn.commit()
+    invalidate_session(session_id)
+
+def delete_expired_sessions(batch_size: int = 1000, max_batches: Optional[int] = None) -> int:
+    """
+    Delete sessions past their expiry, batch_size rows per transaction, so
+    the write lock is never held for long.
+
+    Args:
+        batch_size: Rows deleted per transaction
+        max_batches: Stop after this many batches, None to sweep everything
+
+    Returns:
+        Number of sessions deleted
+    """
+    query = """
+        DELETE FROM sessions
+        WHERE session_id IN (
+            SELECT session_id FROM sessions WHERE expires_at <= ? LIMIT ?
+        )
+        RETURNING session_id
+    """
+    n_deleted = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with connection() as conn:
+            deleted = conn.execute(query, (datetime.now(), batch_size)).fetchall()
+            conn.commit()
+        for (session_id,) in deleted:
+            invalidate_session(session_id)
+        n_deleted += len(deleted)
+        batches += 1
+        if len(deleted) < batch_size:
+            break
+    return n_deleted
+
+def count_sessions() -> int:
+    """Number of rows in the sessions table, expired or not"""
+    with connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
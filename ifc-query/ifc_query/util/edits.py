@@ -0,0 +1,129 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+Key = Tuple[str, str]
+
+# Marks a key that had no edit before a change, so undo removes it again
+_MISSING = object()
+
+
+class EditBuffer:
+    """
+    Pending property edits, keyed by (id, property).
+
+    Upserts are O(1) per edit, and each batch of edits is one step of an
+    undo/redo history. The DataFrame view is only built when asked for, and
+    reused until the edits change again.
+    """
+
+    def __init__(self):
+        self._values: Dict[Key, str] = {}
+        self._undo: List[List[Tuple[Key, object, object]]] = []
+        self._redo: List[List[Tuple[Key, object, object]]] = []
+        self._df: Optional[pd.DataFrame] = None
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __bool__(self) -> bool:
+        return bool(self._values)
+
+    def __contains__(self, key: Key) -> bool:
+        return key in self._values
+
+    def get(self, id_: str, prop: str, default=None):
+        return self._values.get((id_, prop), default)
+
+    def apply(self, edits: Iterable[Tuple[str, str, str]]) -> int:
+        """
+        Upsert a batch of (id, property, value) edits as one undoable step.
+
+        Returns:
+            Number of edits that changed a value
+        """
+        step = []
+        for id_, prop, value in edits:
+            key = (id_, prop)
+            old = self._values.get(key, _MISSING)
+            if old is not _MISSING and old == value:
+                continue
+            self._values[key] = value
+            step.append((key, old, value))
+        if step:
+            self._undo.append(step)
+            self._redo.clear()
+            self._df = None
+        return len(step)
+
+    def discard(self, keys: Iterable[Key]) -> int:
+        """Drop the edits for some (id, property) keys as one undoable step"""
+        step = [(key, self._values.pop(key), _MISSING) for key in keys if key in self._values]
+        if step:
+            self._undo.append(step)
+            self._redo.clear()
+            self._df = None
+        return len(step)
+
+    def _set(self, key: Key, value) -> None:
+        if value is _MISSING:
+            self._values.pop(key, None)
+        else:
+            self._values[key] = value
+
+    @property
+    def can_undo(self) -> bool:
+        return bool(self._undo)
+
+    @property
+    def can_redo(self) -> bool:
+        return bool(self._redo)
+
+    def undo(self) -> bool:
+        """Revert the last batch of edits. Returns False if there is nothing to undo."""
+        if not self._undo:
+            return False
+        step = self._undo.pop()
+        for key, old, _ in reversed(step):
+            self._set(key, old)
+        self._redo.append(step)
+        self._df = None
+        return True
+
+    def redo(self) -> bool:
+        """Reapply the last undone batch of edits. Returns False if there is nothing to redo."""
+        if not self._redo:
+            return False
+        step = self._redo.pop()
+        for key, _, new in step:
+            self._set(key, new)
+        self._undo.append(step)
+        self._df = None
+        return True
+
+    def overlay(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        A copy of a slice of the property table with pending edits in place of the original values.
+
+        Args:
+            df: DataFrame with columns ['id', 'property', 'value'], e.g. one page of the table
+
+        Returns:
+            The slice with object-typed columns, so edited values can be shown as entered
+        """
+        df = df.astype(object)
+        if self._values:
+            df['value'] = [
+                self._values.get((id_, prop), value)
+                for id_, prop, value in zip(df['id'], df['property'], df['value'])
+            ]
+        return df
+
+    def to_df(self) -> pd.DataFrame:
+        """The edits as a DataFrame with columns ['id', 'property', 'value']"""
+        if self._df is None:
+            self._df = pd.DataFrame(
+                [(id_, prop, value) for (id_, prop), value in self._values.items()],
+                columns=['id', 'property', 'value']
+            )
+        return self._df
@@ -0,0 +1,193 @@
+import json
+from dataclasses import dataclass
+from logging import log, WARN
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from ifc_query.util.compose import Prim, Stage
+from ifc_query.util.mesh import MESH_ATTR
+
+XFORM_ATTR = 'xformOp'
+
+# Properties added to the property table by iter_geometry_rows
+WORLD_XFORM_PROPERTY = 'world:xform'
+WORLD_BBOX_PROPERTY = 'world:bbox'
+
+
+@dataclass
+class Hierarchy:
+    """
+    The prim tree of a stage flattened into arrays, in depth-first order, so
+    every parent comes before its children.
+    """
+    paths: List[str]
+    prims: List[Prim]
+    parents: np.ndarray  # (n,) int64, -1 for roots
+    depths: np.ndarray   # (n,) int64, 0 for roots
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+
+@dataclass
+class Geometry:
+    """World-space placement and extents of every prim of a stage"""
+    hierarchy: Hierarchy
+    world: np.ndarray     # (n, 4, 4) float64
+    bbox_min: np.ndarray  # (n, 3) float64, NaN for prims without geometry
+    bbox_max: np.ndarray  # (n, 3) float64
+    has_mesh: np.ndarray  # (n,) bool, whether the prim has a mesh of its own
+
+    def has_bbox(self) -> np.ndarray:
+        return ~np.isnan(self.bbox_min[:, 0])
+
+
+def flatten_hierarchy(stage: Stage) -> Hierarchy:
+    """Flatten the composed prim tree of a stage into parent-index arrays"""
+    paths, prims, parents, depths = [], [], [], []
+    index_of: Dict[str, int] = {}
+    for path, prim in stage.iter_prims():
+        parent = index_of.get(path.rsplit('/', 1)[0], -1)
+        index_of[path] = len(paths)
+        paths.append(path)
+        prims.append(prim)
+        parents.append(parent)
+        depths.append(depths[parent] + 1 if parent >= 0 else 0)
+    return Hierarchy(paths, prims, np.array(parents, dtype=np.int64), np.array(depths, dtype=np.int64))
+
+
+def local_transform(prim: Prim) -> Optional[np.ndarray]:
+    """
+    The xformOp matrix of a prim, None if it has none.
+
+    Matrices are row-major with the translation in the last row, as in USD,
+    so points are row vectors transformed as p @ M.
+    """
+    xform = prim.attributes.get(XFORM_ATTR)
+    if not isinstance(xform, dict) or 'transform' not in xform:
+        return None
+    try:
+        matrix = np.asarray(xform['transform'], dtype=np.float64)
+    except (TypeError, ValueError):
+        matrix = None
+    if matrix is None or matrix.shape != (4, 4):
+        log(WARN, f"Ignoring malformed xformOp on {prim.name}")
+        return None
+    return matrix
+
+
+def local_transforms(hierarchy: Hierarchy) -> np.ndarray:
+    """(n, 4, 4) local matrices of the prims, identity where they have no xformOp"""
+    local = np.broadcast_to(np.eye(4), (len(hierarchy), 4, 4)).copy()
+    for i, prim in enumerate(hierarchy.prims):
+        matrix = local_transform(prim)
+        if matrix is not None:
+            local[i] = matrix
+    return local
+
+
+def world_transforms(parents: np.ndarray, depths: np.ndarray, local: np.ndarray) -> np.ndarray:
+    """
+    Compose local matrices down the hierarchy, one batched matmul per level.
+
+    Args:
+        parents: (n,) index of each prim's parent, -1 for roots
+        depths: (n,) depth of each prim, 0 for roots
+        local: (n, 4, 4) local matrices, in the row-vector convention
+
+    Returns:
+        (n, 4, 4) world matrices, world = local @ parent_world
+    """
+    world = local.copy()
+    for depth in range(1, int(depths.max(initial=0)) + 1):
+        level = np.flatnonzero(depths == depth)
+        world[level] = local[level] @ world[parents[level]]
+    return world
+
+
+def mesh_bounds(hierarchy: Hierarchy) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Local-space bounds of each prim's own mesh points.
+
+    Returns:
+        (n, 3) minimum and maximum corners, NaN for prims without a mesh
+    """
+    bbox_min = np.full((len(hierarchy), 3), np.nan)
+    bbox_max = np.full((len(hierarchy), 3), np.nan)
+    # Instances of a class share its mesh value, so each is only reduced once
+    bounds: Dict[int, Optional[Tuple[np.ndarray, np.ndarray]]] = {}
+    for i, prim in enumerate(hierarchy.prims):
+        mesh = prim.attributes.get(MESH_ATTR)
+        if not isinstance(mesh, dict):
+            continue
+        if id(mesh) not in bounds:
+            try:
+                points = np.asarray(mesh.get('points') or [], dtype=np.float64).reshape(-1, 3)
+            except (TypeError, ValueError):
+                log(WARN, f"Ignoring malformed mesh points on {hierarchy.paths[i]}")
+                points = np.empty((0, 3))
+            bounds[id(mesh)] = (points.min(axis=0), points.max(axis=0)) if len(points) else None
+        if bounds[id(mesh)] is not None:
+            bbox_min[i], bbox_max[i] = bounds[id(mesh)]
+    return bbox_min, bbox_max
+
+
+def transform_bounds(bbox_min: np.ndarray, bbox_max: np.ndarray, matrices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Axis-aligned bounds of boxes after an affine transform, for a batch of boxes.
+
+    Uses the center and half-extent form: the center is transformed as a
+    point and the extent by the absolute values of the linear part, which
+    gives the same result as transforming all eight corners.
+    """
+    center = (bbox_min + bbox_max) / 2
+    extent = (bbox_max - bbox_min) / 2
+    linear = matrices[:, :3, :3]
+    world_center = np.einsum('ni,nij->nj', center, linear) + matrices[:, 3, :3]
+    world_extent = np.einsum('ni,nij->nj', extent, np.abs(linear))
+    return world_center - world_extent, world_center + world_extent
+
+
+def compute_geometry(stage: Stage) -> Geometry:
+    """
+    World transforms and world-space bounding boxes of every prim of a stage.
+
+    A prim's box covers its own mesh and those of all its descendants, so
+    e.g. a window Xform gets the extents of its Body mesh. The stage must be
+    composed with the UsdGeom:Mesh attributes for boxes to be computed.
+    """
+    hierarchy = flatten_hierarchy(stage)
+    world = world_transforms(hierarchy.parents, hierarchy.depths, local_transforms(hierarchy))
+    bbox_min, bbox_max = transform_bounds(*mesh_bounds(hierarchy), world)
+    has_mesh = ~np.isnan(bbox_min[:, 0])
+
+    # Merge boxes up the tree, deepest level first; fmin/fmax skip the NaNs
+    # of prims without geometry
+    for depth in range(int(hierarchy.depths.max(initial=0)), 0, -1):
+        level = np.flatnonzero(hierarchy.depths == depth)
+        np.fmin.at(bbox_min, hierarchy.parents[level], bbox_min[level])
+        np.fmax.at(bbox_max, hierarchy.parents[level], bbox_max[level])
+    return Geometry(hierarchy, world, bbox_min, bbox_max, has_mesh)
+
+
+def iter_geometry_rows(geometry: Geometry) -> Iterator[Tuple[str, str, str]]:
+    """
+    Flatten world transforms and bounding boxes to property rows.
+
+    Rows are keyed by prim path like iter_prim_rows, since each instance of a
+    class has its own placement. Values have the same shape as xformOp, and
+    {"min": [x, y, z], "max": [x, y, z]} for boxes, so their leaves can be
+    filtered like any other property, e.g. json_path '$.min[2]'.
+
+    Yields:
+        (path, property, value) tuples, with value JSON-encoded
+    """
+    has_bbox = geometry.has_bbox()
+    world = geometry.world.tolist()
+    bbox_min = geometry.bbox_min.tolist()
+    bbox_max = geometry.bbox_max.tolist()
+    for i, path in enumerate(geometry.hierarchy.paths):
+        yield path, WORLD_XFORM_PROPERTY, json.dumps({'transform': world[i]})
+        if has_bbox[i]:
+            yield path, WORLD_BBOX_PROPERTY, json.dumps({'min': bbox_min[i], 'max': bbox_max[i]})
@@ -1,91 +1,268 @@
 import json
+import numpy as np
 import pandas as pd
 import io
+from array import array
+from typing import Dict, Iterable, Iterator, List, Tuple
 
-import streamlit as st
+from ifc_query.util.compose import Stage, StageDiff, iter_stage_rows
+from ifc_query.util.stream import iter_objects
 
+IGNORE_ATTRS = ['UsdGeom:Mesh', 'xfromOp', 'UsdShade:Material']
 
-def ifcx_to_df(ifcx_file: io.BytesIO) -> pd.DataFrame:
+# Bump whenever the flattened tables change shape or content, so that cached
+# tables built by an older parser are not reused
+PARSER_VERSION = 1
+
+
+def iter_ifcx_rows(ifcx_file: io.BytesIO, batch_size: int = 10_000) -> Iterator[List[Tuple[str, str, str]]]:
     """
-    Dummy function that converts an IFCX file to a pandas DataFrame.
-    In a real implementation, this would parse the IFCX file and extract properties.
-    
+    Stream the (id, property, value) rows of an IFCX file in batches.
+
+    Only top-level "over" objects with attributes are flattened. The file is
+    parsed incrementally and ignored attributes are skipped without being
+    decoded, so peak memory depends on the largest kept object rather than on
+    the size of the file.
+
     Args:
         ifcx_file: A BytesIO object containing the IFCX file contents
-        
-    Returns:
-        DataFrame with columns ['id', 'property', 'value']
+        batch_size: Maximum number of rows per yielded batch
+
+    Yields:
+        Lists of (id, property, value) tuples, with value JSON-encoded
     """
-    # Dummy data for testing
-    
-    data = json.load(ifcx_file)
+    batch = []
+    for obj in iter_objects(ifcx_file, skip_attributes=IGNORE_ATTRS):
+        if not isinstance(obj, dict) or obj.get("def") != "over" or "attributes" not in obj:
+            continue
+        for prop, value in obj['attributes'].items():
+            batch.append((obj.get('name'), prop, json.dumps(value)))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-    filtered_data = [
-        obj for obj in data 
-        if obj.get("def") == "over" and "attributes" in obj
-    ]
+class PropertyColumns:
+    """
+    Column-wise builder for the flattened (id, property, value) table.
+
+    Ids and property names repeat heavily across an IFCX model, so each is
+    stored once and rows only keep integer codes into those categories.
+    """
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.properties: Dict[str, int] = {}
+        self.id_codes = array('q')
+        self.property_codes = array('q')
+        self.values: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.values)
 
-    ignore_attrs = ['UsdGeom:Mesh', 'xfromOp', 'UsdShade:Material']
+    def extend(self, rows: Iterable[Tuple[str, str, str]]) -> None:
+        """Append (id, property, value) rows to the columns"""
+        ids, properties = self.ids, self.properties
+        id_codes, property_codes, values = self.id_codes, self.property_codes, self.values
+        for id_, prop, value in rows:
+            code = ids.get(id_)
+            if code is None:
+                code = ids[id_] = len(ids)
+            id_codes.append(code)
+            code = properties.get(prop)
+            if code is None:
+                code = properties[prop] = len(properties)
+            property_codes.append(code)
+            values.append(value)
 
-    flattened_data = []
+    def to_df(self, dtype_backend: str = 'numpy') -> pd.DataFrame:
+        """
+        Build the DataFrame with categorical id and property columns.
 
-    for obj in filtered_data:
-        for prop, value in obj.get('attributes', {}).items():
-            if prop in ignore_attrs:
-                continue
-            flattened_data.append({
-                'id': obj.get('name'),
-                'property': prop,
-                'value': json.dumps(value)
+        Args:
+            dtype_backend: 'numpy' for pandas categoricals, or 'pyarrow' for
+                Arrow-backed dictionary and string columns
+
+        Returns:
+            DataFrame with columns ['id', 'property', 'value']
+        """
+        id_codes = np.frombuffer(self.id_codes, dtype=np.int64)
+        property_codes = np.frombuffer(self.property_codes, dtype=np.int64)
+
+        if dtype_backend == 'pyarrow':
+            import pyarrow as pa
+
+            table = pa.table({
+                'id': pa.DictionaryArray.from_arrays(
+                    pa.array(id_codes, type=pa.int32()), pa.array(list(self.ids), type=pa.string())),
+                'property': pa.DictionaryArray.from_arrays(
+                    pa.array(property_codes, type=pa.int32()), pa.array(list(self.properties), type=pa.string())),
+                'value': pa.array(self.values, type=pa.large_string()),
             })
-    
-    return pd.DataFrame(flattened_data)
+            return table.to_pandas(types_mapper=pd.ArrowDtype)
+        if dtype_backend != 'numpy':
+            raise ValueError(f"Unknown dtype_backend: {dtype_backend}")
 
-def df_to_ifcx(df: pd.DataFrame) -> str:
+        return pd.DataFrame({
+            'id': pd.Categorical.from_codes(id_codes, categories=list(self.ids)),
+            'property': pd.Categorical.from_codes(property_codes, categories=list(self.properties)),
+            'value': pd.Series(self.values, dtype=object),
+        })
+
+def ifcx_to_df(ifcx_file: io.BytesIO, dtype_backend: str = 'numpy') -> pd.DataFrame:
     """
-    Dummy function that converts a DataFrame of edits back to IFCX format.
-    In a real implementation, this would generate valid IFCX content.
+    Converts an IFCX file to a pandas DataFrame of properties.
     
     Args:
-        df: DataFrame containing the edits with columns ['id', 'property', 'value']
+        ifcx_file: A BytesIO object containing the IFCX file contents
+        dtype_backend: 'numpy' (default) or 'pyarrow' for Arrow-backed columns
         
     Returns:
-        String containing the IFCX file content
+        DataFrame with categorical columns ['id', 'property'] and a 'value' column
+    """
+    columns = PropertyColumns()
+    for batch in iter_ifcx_rows(ifcx_file):
+        columns.extend(batch)
+    return columns.to_df(dtype_backend)
+
+def ifcx_layers_to_df(ifcx_files: Iterable[io.BytesIO], dtype_backend: str = 'numpy') -> pd.DataFrame:
+    """
+    Composes a stack of IFCX layers and flattens the composed properties.
+
+    Unlike ifcx_to_df, which only reads the "over" objects of a single file,
+    this resolves inherits, children and the overs of every layer, so each
+    row holds the value a viewer of the composed model would see.
+
+    Args:
+        ifcx_files: IFCX files, weakest (base model) first
+        dtype_backend: 'numpy' (default) or 'pyarrow' for Arrow-backed columns
+
+    Returns:
+        DataFrame with columns ['id', 'property', 'value'], one row per
+        composed attribute of each named object
+    """
+    stage = Stage(iter_objects(f, skip_attributes=IGNORE_ATTRS) for f in ifcx_files)
+    columns = PropertyColumns()
+    columns.extend(iter_stage_rows(stage))
+    return columns.to_df(dtype_backend)
+
+def apply_stage_diff(df: pd.DataFrame, diff: StageDiff, ignore_attrs=IGNORE_ATTRS) -> pd.DataFrame:
+    """
+    Applies the row changes reported by Stage.add_layer/remove_layer to a
+    flattened property table, instead of rebuilding it from the whole stage.
+
+    Args:
+        df: DataFrame with columns ['id', 'property', 'value']
+        diff: The changes to apply
+        ignore_attrs: Attribute names left out of the table
+
+    Returns:
+        The updated DataFrame, with categorical id and property columns
+    """
+    upserts = [row for row in diff.upserts if row[1] not in ignore_attrs]
+    changed = set(diff.deletes) | {(id_, prop) for id_, prop, _ in upserts}
+    if not changed:
+        return df
+
+    keys = pd.MultiIndex.from_arrays([df['id'], df['property']])
+    columns = PropertyColumns()
+    columns.extend(upserts)
+    kept = df[~keys.isin(list(changed))]
+    # Concatenating empty frames is deprecated in pandas, so they are left out
+    parts = [part for part in (kept, columns.to_df()) if len(part)]
+    updated = pd.concat(parts, ignore_index=True) if parts else kept.reset_index(drop=True)
+    return updated.astype({'id': 'category', 'property': 'category'})
+
+def _pattern_mask(column: pd.Series, pattern: str) -> np.ndarray:
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        # Match each distinct name once, then select rows by category code
+        hits = column.cat.categories.str.contains(pattern, case=False, regex=False)
+        return np.isin(column.cat.codes.to_numpy(), np.flatnonzero(hits))
+    return column.astype(str).str.contains(pattern, case=False, regex=False).to_numpy(dtype=bool)
+
+def filter_positions(df: pd.DataFrame, id_pattern: str = '', property_pattern: str = '') -> np.ndarray:
+    """
+    Finds the rows of a property table whose id and property contain the given patterns.
+
+    Args:
+        df: DataFrame with columns ['id', 'property', 'value']
+        id_pattern: Case-insensitive substring of the id, empty matches everything
+        property_pattern: Case-insensitive substring of the property, empty matches everything
+
+    Returns:
+        Positions of the matching rows, in table order, for use with df.iloc
     """
-    # Dummy IFCX content for testing
-    over_template = """{
-     "def": "over",
-     "name": "{0}",
-     "attributes": {
-        "{1}": "{2}"
-        }
-    }"""
+    mask = np.ones(len(df), dtype=bool)
+    if id_pattern:
+        mask &= _pattern_mask(df['id'], id_pattern)
+    if property_pattern:
+        mask &= _pattern_mask(df['property'], property_pattern)
+    return np.flatnonzero(mask)
 
-    overs = []
+def _decode_value(value):
+    """Values are JSON text; anything that does not parse is kept as a plain string"""
+    if not isinstance(value, str):
+        return None if pd.isna(value) else value
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+def iter_overs(df: pd.DataFrame) -> Iterator[dict]:
+    """
+    Groups a DataFrame of edits by id into one "over" per prim.
 
-    # Check if the DataFrame has the required columns
+    Args:
+        df: DataFrame containing the edits with columns ['id', 'property', 'value']
+
+    Yields:
+        {"def": "over", "name": id, "attributes": {...}} in order of first appearance;
+        if an (id, property) pair repeats, the last value wins
+    """
     required_columns = {'id', 'property', 'value'}
     if not required_columns.issubset(df.columns):
         raise KeyError(f"DataFrame is missing one of the required columns: {required_columns}")
 
-    for index, row in df.iterrows():
-        # Ensure each row has the required keys
-        try:
-            id_value = row['id']
-            property_value = row['property']
-            value_value = row['value']
-        except KeyError as e:
-            raise KeyError(f"Missing key in row {index}: {e}")
-
-        st.write(id_value)
-        st.write(property_value)
-        st.write(value_value)
-        overs.append(f"""{{
-     "def": "over",
-     "name": "{id_value}",
-     "attributes": {{
-        "{property_value}": {value_value}
-     }}
-    }}""")
-
-    return "[" + ",".join(overs) + "]" 
\ No newline at end of file
+    overs: Dict[str, dict] = {}
+    for id_value, property_value, value_value in zip(
+        df['id'].to_numpy(dtype=object),
+        df['property'].to_numpy(dtype=object),
+        df['value'].to_numpy(dtype=object),
+    ):
+        attributes = overs.get(id_value)
+        if attributes is None:
+            attributes = overs[id_value] = {}
+        attributes[property_value] = _decode_value(value_value)
+
+    for id_value, attributes in overs.items():
+        yield {"def": "over", "name": id_value, "attributes": attributes}
+
+def write_ifcx(df: pd.DataFrame, fp: io.TextIOBase) -> None:
+    """
+    Streams a DataFrame of edits to a file as an IFCX layer, one over per line.
+
+    Args:
+        df: DataFrame containing the edits with columns ['id', 'property', 'value']
+        fp: Text file to write to
+    """
+    encoder = json.JSONEncoder(ensure_ascii=False)
+    fp.write('[')
+    for i, over in enumerate(iter_overs(df)):
+        fp.write(',\n' if i else '\n')
+        fp.write(encoder.encode(over))
+    fp.write('\n]\n')
+
+def df_to_ifcx(df: pd.DataFrame) -> str:
+    """
+    Converts a DataFrame of edits to an IFCX layer that can be stacked over the edited model.
+    
+    Args:
+        df: DataFrame containing the edits with columns ['id', 'property', 'value']
+        
+    Returns:
+        String containing the IFCX file content
+    """
+    buffer = io.StringIO()
+    write_ifcx(df, buffer)
+    return buffer.getvalue()
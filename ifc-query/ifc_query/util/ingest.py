@@ -0,0 +1,586 @@
+import itertools
+import io
+import json
+import os
+import re
+import sqlite3
+from collections import Counter
+from datetime import datetime
+from logging import log, INFO, WARN
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from ifc_query.util.batch import Progress, parse_layers
+from ifc_query.util.compose import Stage, StageDiff, iter_stage_rows
+from ifc_query.util.db import DB_FOLDER
+from ifc_query.util.geometry import (
+    WORLD_BBOX_PROPERTY, WORLD_XFORM_PROPERTY, Geometry, compute_geometry, iter_geometry_rows
+)
+from ifc_query.util.ifc import IGNORE_ATTRS, iter_ifcx_rows
+from ifc_query.util.mesh import MESH_ATTR, MeshInterner, mesh_arrays, mesh_key
+from ifc_query.util.spatial import register_functions
+from ifc_query.util.stream import iter_objects
+
+MODELS_DB_PATH = DB_FOLDER / Path('models.db')
+
+BATCH_SIZE = 10_000
+
+# Values with more scalar leaves than this (long coordinate lists and the
+# like) only have their first leaves indexed, plus a row with
+# TRUNCATED_JSON_PATH marking the value as truncated
+MAX_LEAVES_PER_VALUE = 256
+# Never produced by iter_leaves, since it is not a valid JSON path
+TRUNCATED_JSON_PATH = '$#truncated'
+
+_IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+COMPARISONS = ('=', '!=', '<', '<=', '>', '>=')
+
+
+def get_models_connection(path: Path = MODELS_DB_PATH) -> sqlite3.Connection:
+    """Open the database holding ingested IFCX models, creating it if needed"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    register_functions(conn)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS models (
+            name TEXT PRIMARY KEY,
+            table_name TEXT NOT NULL UNIQUE,
+            rows INTEGER NOT NULL,
+            ingested_at TIMESTAMP NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS models_version (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            version INTEGER NOT NULL
+        )
+    ''')
+    return conn
+
+
+def models_version(conn: Optional[sqlite3.Connection] = None) -> int:
+    """
+    A counter that changes whenever a model is ingested or updated.
+
+    Bumped by bump_models_version in the same transaction as the change, so
+    a reader that sees the new version also sees the new rows, including
+    changes made by other processes.
+    """
+    return _with_connection(conn, lambda c: c.execute(
+        'SELECT COALESCE((SELECT version FROM models_version WHERE id = 0), 0)'
+    ).fetchone()[0])
+
+
+def bump_models_version(conn: sqlite3.Connection) -> None:
+    """Mark the models database as changed, inside the transaction making the change"""
+    conn.execute(
+        'INSERT INTO models_version (id, version) VALUES (0, 1) ON CONFLICT (id) DO UPDATE SET version = version + 1'
+    )
+
+
+def model_table_name(model: str) -> str:
+    """Name of the per-model property table, e.g. 'props_hello_wall'"""
+    slug = re.sub(r'\W+', '_', model).strip('_').lower()
+    if not slug:
+        raise ValueError(f"Invalid model name: {model!r}")
+    return f"props_{slug}"
+
+
+def _check_table_owner(conn: sqlite3.Connection, model: str, table: str) -> None:
+    """
+    Refuse to write the tables of a model whose name maps to the same
+    tables as another ingested model, e.g. 'Hello Wall' and 'hello-wall'.
+    """
+    owner = conn.execute('SELECT name FROM models WHERE table_name = ? AND name != ?', (table, model)).fetchone()
+    if owner is not None:
+        raise ValueError(f"Model name {model!r} clashes with the ingested model {owner[0]!r}, use another name")
+
+
+def model_leaves_table_name(model: str) -> str:
+    """Name of the JSON-path index of a model, e.g. 'props_hello_wall_leaves'"""
+    return f"{model_table_name(model)}_leaves"
+
+
+def model_rtree_table_name(model: str) -> str:
+    """Name of the R*Tree of a model's world bounding boxes, e.g. 'props_hello_wall_rtree'"""
+    return f"{model_table_name(model)}_rtree"
+
+
+def model_geometries_table_name(model: str) -> str:
+    """Name of the table of a model's unique mesh geometries, e.g. 'props_hello_wall_geometries'"""
+    return f"{model_table_name(model)}_geometries"
+
+
+def model_instances_table_name(model: str) -> str:
+    """Name of the table placing a model's geometries, e.g. 'props_hello_wall_instances'"""
+    return f"{model_table_name(model)}_instances"
+
+
+def iter_leaves(value, path: str = '$') -> Iterator[Tuple[str, Optional[float], Optional[str]]]:
+    """
+    Walk the scalar leaves of a decoded JSON value.
+
+    Paths use SQLite's JSON path syntax, so they can be fed straight to
+    json_extract(value, path), e.g. '$.transform[3][0]' or '$."bsi::Width"'.
+
+    Yields:
+        (json_path, num_value, str_value) with numbers and booleans in
+        num_value and strings in str_value; nulls are skipped
+    """
+    if isinstance(value, dict):
+        for key, item in value.items():
+            step = f".{key}" if _IDENTIFIER.fullmatch(key) else '.' + json.dumps(key)
+            yield from iter_leaves(item, path + step)
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            yield from iter_leaves(item, f"{path}[{i}]")
+    elif isinstance(value, str):
+        yield path, None, value
+    elif isinstance(value, (int, float)):
+        yield path, float(value), None
+
+
+def _leaf_rows(rows: Iterable[Tuple[str, str, str]]) -> Iterator[Tuple[str, str, str, Optional[float], Optional[str]]]:
+    for id_, prop, value in rows:
+        try:
+            decoded = json.loads(value)
+        except (TypeError, ValueError):
+            continue
+        leaves = iter_leaves(decoded)
+        for json_path, num_value, str_value in itertools.islice(leaves, MAX_LEAVES_PER_VALUE):
+            yield id_, prop, json_path, num_value, str_value
+        if next(leaves, None) is not None:
+            yield id_, prop, TRUNCATED_JSON_PATH, None, None
+
+
+def _create_leaves_table(conn: sqlite3.Connection, table: str) -> None:
+    conn.execute(f'''
+        CREATE TABLE "{table}" (
+            id TEXT NOT NULL,
+            property TEXT NOT NULL,
+            json_path TEXT NOT NULL,
+            num_value REAL,
+            str_value TEXT
+        )
+    ''')
+
+
+def _index_leaves_table(conn: sqlite3.Connection, table: str) -> None:
+    conn.execute(f'CREATE INDEX "idx_{table}_num" ON "{table}" (property, json_path, num_value)')
+    conn.execute(f'CREATE INDEX "idx_{table}_str" ON "{table}" (property, json_path, str_value)')
+    conn.execute(f'CREATE INDEX "idx_{table}_id" ON "{table}" (id, property)')
+
+
+def _index_bboxes(conn: sqlite3.Connection, table: str, rtree_table: str) -> None:
+    """
+    Load the world:bbox rows of a model into an R*Tree, for spatial queries in SQL.
+
+    Box and clash queries on min_x..max_z use the tree, e.g. every prim
+    intersecting a box, or (with a self-join) every intersecting pair; for
+    radius and nearest queries, see spatial.register_functions.
+    """
+    conn.execute(f'DROP TABLE IF EXISTS "{rtree_table}"')
+    if conn.execute(f'SELECT 1 FROM "{table}" WHERE property = ? LIMIT 1', (WORLD_BBOX_PROPERTY,)).fetchone() is None:
+        return
+    try:
+        conn.execute(f'''
+            CREATE VIRTUAL TABLE "{rtree_table}" USING rtree(
+                id, min_x, max_x, min_y, max_y, min_z, max_z, +path TEXT
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        # SQLite builds without the R*Tree module
+        log(WARN, f"Not creating {rtree_table}: {e}")
+        return
+    conn.execute(f'''
+        INSERT INTO "{rtree_table}" (min_x, max_x, min_y, max_y, min_z, max_z, path)
+        SELECT
+            json_extract(value, '$.min[0]'), json_extract(value, '$.max[0]'),
+            json_extract(value, '$.min[1]'), json_extract(value, '$.max[1]'),
+            json_extract(value, '$.min[2]'), json_extract(value, '$.max[2]'),
+            id
+        FROM "{table}" WHERE property = ?
+    ''', (WORLD_BBOX_PROPERTY,))
+
+
+def _store_instances(conn: sqlite3.Connection, model: str, geometry: Optional[Geometry]) -> None:
+    """
+    Store each unique mesh of a model once, and every prim with a mesh as an instance of it.
+
+    Geometries are keyed by mesh.mesh_key and hold their points and triangle
+    indices as little-endian float32 and uint32 blobs, ready for a viewer;
+    instances are (path, geometry_id, world transform).
+    """
+    geometries_table = model_geometries_table_name(model)
+    instances_table = model_instances_table_name(model)
+    conn.execute(f'DROP TABLE IF EXISTS "{geometries_table}"')
+    conn.execute(f'DROP TABLE IF EXISTS "{instances_table}"')
+    if geometry is None:
+        return
+    conn.execute(f'''
+        CREATE TABLE "{geometries_table}" (
+            id TEXT PRIMARY KEY,
+            vertex_count INTEGER NOT NULL,
+            triangle_count INTEGER NOT NULL,
+            instances INTEGER NOT NULL,
+            points BLOB NOT NULL,
+            indices BLOB NOT NULL
+        )
+    ''')
+    conn.execute(f'''
+        CREATE TABLE "{instances_table}" (
+            path TEXT PRIMARY KEY,
+            geometry_id TEXT NOT NULL,
+            transform TEXT NOT NULL
+        )
+    ''')
+
+    keys: Dict[int, Optional[str]] = {}
+    arrays = {}
+    instances = []
+    for i in np.flatnonzero(geometry.has_mesh).tolist():
+        path = geometry.hierarchy.paths[i]
+        mesh = geometry.hierarchy.prims[i].attributes[MESH_ATTR]
+        # Interned meshes are shared, so most lookups skip the hashing
+        if id(mesh) not in keys:
+            try:
+                key = mesh_key(mesh)
+                if key is not None and key not in arrays:
+                    arrays[key] = mesh_arrays(mesh)
+            except (TypeError, ValueError, IndexError) as e:
+                log(WARN, f"Not storing the mesh of {path}: {e}")
+                key = None
+            keys[id(mesh)] = key
+        key = keys[id(mesh)]
+        if key is not None and arrays[key] is not None:
+            instances.append((path, key, json.dumps(geometry.world[i].tolist())))
+
+    counts = Counter(key for _, key, _ in instances)
+    conn.executemany(
+        f'INSERT INTO "{geometries_table}" VALUES (?, ?, ?, ?, ?, ?)',
+        (
+            (key, len(arrays[key].points), arrays[key].n_triangles, count,
+             arrays[key].points.astype('<f4').tobytes(), arrays[key].indices.astype('<u4').tobytes())
+            for key, count in counts.items()
+        )
+    )
+    conn.executemany(f'INSERT INTO "{instances_table}" VALUES (?, ?, ?)', instances)
+    conn.execute(f'CREATE INDEX "idx_{instances_table}_geometry" ON "{instances_table}" (geometry_id)')
+    log(INFO, f"Stored {len(instances)} mesh instances of {len(counts)} geometries for {model}")
+
+
+def mesh_stats(conn: sqlite3.Connection, model: str) -> Optional[Tuple[int, int]]:
+    """
+    (instances, unique geometries) of a model ingested with geometry, None otherwise.
+
+    Their ratio is how many times over the meshes would be stored without deduplication.
+    """
+    try:
+        instances, geometries = conn.execute(
+            f'SELECT COALESCE(SUM(instances), 0), COUNT(*) FROM "{model_geometries_table_name(model)}"'
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return instances, geometries
+
+
+def ingest_rows(conn: sqlite3.Connection, model: str, rows: Iterable[Tuple[str, str, str]],
+                geometry: Optional[Geometry] = None) -> int:
+    """
+    Load (id, property, value) rows into the table of a model, replacing its previous contents.
+
+    Rows are inserted with batched executemany in a single transaction, and
+    the (id) and (property) indexes are built once all rows are in, which is
+    much faster than maintaining them row by row.
+
+    The scalar leaves of every value are also extracted into the model's
+    leaves table, indexed by (property, json_path, value), so filters on
+    nested values such as xformOp's $.transform[3][0] do not have to decode
+    every value in the model. Only the first MAX_LEAVES_PER_VALUE leaves of
+    a value are indexed; larger values also get a TRUNCATED_JSON_PATH row.
+
+    Models with world:bbox rows (see ingest_layers) also get an R*Tree of
+    their boxes, in the table named by model_rtree_table_name.
+
+    Args:
+        conn: Connection from get_models_connection
+        model: Name of the model
+        rows: The rows to load, consumed lazily
+        geometry: The model's prim geometry, to store its meshes as geometries
+            and instances (see _store_instances)
+
+    Returns:
+        Number of rows loaded
+
+    Raises:
+        ValueError: If the model's tables belong to another ingested model
+            whose name differs only in case or punctuation
+    """
+    table = model_table_name(model)
+    leaves_table = model_leaves_table_name(model)
+    n_rows = 0
+    with conn:
+        # Explicit, so the DDL is part of the transaction too and readers see
+        # either the old table or the complete new one
+        conn.execute('BEGIN IMMEDIATE')
+        _check_table_owner(conn, model, table)
+        conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+        conn.execute(f'''
+            CREATE TABLE "{table}" (
+                id TEXT NOT NULL,
+                property TEXT NOT NULL,
+                value TEXT
+            )
+        ''')
+        conn.execute(f'DROP TABLE IF EXISTS "{leaves_table}"')
+        _create_leaves_table(conn, leaves_table)
+        insert = f'INSERT INTO "{table}" (id, property, value) VALUES (?, ?, ?)'
+        insert_leaves = f'INSERT INTO "{leaves_table}" VALUES (?, ?, ?, ?, ?)'
+        for batch in itertools.batched(rows, BATCH_SIZE):
+            conn.executemany(insert, batch)
+            conn.executemany(insert_leaves, _leaf_rows(batch))
+            n_rows += len(batch)
+        conn.execute(f'CREATE INDEX "idx_{table}_id" ON "{table}" (id)')
+        conn.execute(f'CREATE INDEX "idx_{table}_property" ON "{table}" (property)')
+        _index_leaves_table(conn, leaves_table)
+        _index_bboxes(conn, table, model_rtree_table_name(model))
+        _store_instances(conn, model, geometry)
+        conn.execute(
+            '''
+            INSERT INTO models (name, table_name, rows, ingested_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET
+                table_name = excluded.table_name, rows = excluded.rows, ingested_at = excluded.ingested_at
+            ''',
+            (model, table, n_rows, datetime.now())
+        )
+        bump_models_version(conn)
+    log(INFO, f"Ingested {n_rows} rows into {table}")
+    return n_rows
+
+
+def ingest_ifcx(ifcx_file: io.BytesIO, model: str, conn: Optional[sqlite3.Connection] = None) -> int:
+    """
+    Stream the "over" properties of a single IFCX file into SQLite.
+
+    The file is parsed incrementally and never held in memory as a whole,
+    so this scales to files much larger than RAM.
+    """
+    rows = (row for batch in iter_ifcx_rows(ifcx_file) for row in batch)
+    return _with_connection(conn, lambda c: ingest_rows(c, model, rows))
+
+
+def _skip_attributes(geometry: bool) -> List[str]:
+    return [attr for attr in IGNORE_ATTRS if not (geometry and attr == MESH_ATTR)]
+
+
+def read_layer(ifcx_file: io.BytesIO, geometry: bool = False,
+               meshes: Optional[MeshInterner] = None) -> Iterator[dict]:
+    """
+    The objects of one IFCX layer, parsed as compose_layers does, e.g. for Stage.add_layer.
+
+    Args:
+        ifcx_file: The layer
+        geometry: Keep the mesh attributes
+        meshes: Interner shared with the layers already on the stage
+    """
+    objects = iter_objects(ifcx_file, skip_attributes=_skip_attributes(geometry))
+    return meshes.intern_objects(objects) if meshes is not None else objects
+
+
+def compose_layers(ifcx_files: Iterable[io.BytesIO], max_workers: Optional[int] = 1,
+                   progress: Optional[Progress] = None, geometry: bool = False,
+                   meshes: Optional[MeshInterner] = None) -> Stage:
+    """
+    Compose a stack of IFCX layers (base model first) for ingest_stage.
+
+    With max_workers other than 1 the files are parsed in a process pool
+    (None for one process per CPU), see batch.parse_layers.
+
+    With geometry the meshes are parsed too, and identical ones are interned
+    as they are read, by meshes if given.
+    """
+    skip = _skip_attributes(geometry)
+    if max_workers == 1 and progress is None:
+        layers = (iter_objects(f, skip_attributes=skip) for f in ifcx_files)
+    else:
+        layers = parse_layers(list(ifcx_files), max_workers, progress, skip_attributes=skip)
+    if geometry:
+        meshes = MeshInterner() if meshes is None else meshes
+        layers = (meshes.intern_objects(layer) for layer in layers)
+    stage = Stage(layers)
+    if geometry:
+        meshes.report()
+    return stage
+
+
+def ingest_stage(stage: Stage, model: str, conn: Optional[sqlite3.Connection] = None,
+                 geometry: bool = False) -> int:
+    """
+    Load the composed properties of every named object of a stage into SQLite.
+
+    With geometry (the stage must have been composed with its meshes), the
+    world transform and world bounding box of every prim are added as
+    'world:xform' and 'world:bbox' rows keyed by prim path, see
+    geometry.iter_geometry_rows, and the meshes are stored once each, with
+    the prims using them as instances, see mesh_stats for the savings.
+    """
+    rows = iter_stage_rows(stage, ignore_attrs=IGNORE_ATTRS)
+    prims_geometry = None
+    if geometry:
+        prims_geometry = compute_geometry(stage)
+        rows = itertools.chain(rows, iter_geometry_rows(prims_geometry))
+    return _with_connection(conn, lambda c: ingest_rows(c, model, rows, prims_geometry))
+
+
+def ingest_layers(ifcx_files: Iterable[io.BytesIO], model: str, conn: Optional[sqlite3.Connection] = None,
+                  max_workers: Optional[int] = 1, progress: Optional[Progress] = None,
+                  geometry: bool = False) -> int:
+    """
+    Compose a stack of IFCX layers (base model first) and load the composed
+    properties of every named object into SQLite, see compose_layers and
+    ingest_stage.
+    """
+    stage = compose_layers(ifcx_files, max_workers, progress, geometry)
+    return ingest_stage(stage, model, conn, geometry)
+
+
+def _replace_rows(conn: sqlite3.Connection, table: str, leaves_table: str,
+                  deletes: List[Tuple[str, str]], upserts: List[Tuple[str, str, str]]) -> None:
+    changed = deletes + [(id_, prop) for id_, prop, _ in upserts]
+    conn.executemany(f'DELETE FROM "{table}" WHERE id = ? AND property = ?', changed)
+    conn.executemany(f'DELETE FROM "{leaves_table}" WHERE id = ? AND property = ?', changed)
+    conn.executemany(f'INSERT INTO "{table}" (id, property, value) VALUES (?, ?, ?)', upserts)
+    conn.executemany(f'INSERT INTO "{leaves_table}" VALUES (?, ?, ?, ?, ?)', _leaf_rows(upserts))
+
+
+def _has_geometry_rows(conn: sqlite3.Connection, table: str) -> bool:
+    return conn.execute(
+        f'SELECT 1 FROM "{table}" WHERE property IN (?, ?) LIMIT 1', (WORLD_XFORM_PROPERTY, WORLD_BBOX_PROPERTY)
+    ).fetchone() is not None
+
+
+def _refresh_geometry(conn: sqlite3.Connection, model: str, geometry: Geometry) -> int:
+    """
+    Bring the world rows, R*Tree and instances of a model in line with the
+    geometry of its updated stage.
+
+    Only the world:xform and world:bbox rows whose value changed are
+    rewritten; the R*Tree and instance tables are rebuilt from them.
+
+    Returns:
+        Number of world rows rewritten or deleted
+    """
+    table = model_table_name(model)
+    old = {
+        (id_, prop): value for id_, prop, value in conn.execute(
+            f'SELECT id, property, value FROM "{table}" WHERE property IN (?, ?)',
+            (WORLD_XFORM_PROPERTY, WORLD_BBOX_PROPERTY)
+        )
+    }
+    upserts = []
+    for id_, prop, value in iter_geometry_rows(geometry):
+        if old.pop((id_, prop), None) != value:
+            upserts.append((id_, prop, value))
+    _replace_rows(conn, table, model_leaves_table_name(model), list(old), upserts)
+    _index_bboxes(conn, table, model_rtree_table_name(model))
+    _store_instances(conn, model, geometry)
+    return len(upserts) + len(old)
+
+
+def apply_diffs(conn: sqlite3.Connection, model: str, diffs: Iterable[StageDiff],
+                geometry: Optional[Geometry] = None) -> None:
+    """
+    Apply the row changes of Stage.add_layer/remove_layer to an ingested
+    model, in order and in one transaction, instead of ingesting it again.
+
+    Args:
+        conn: Connection from get_models_connection
+        model: Name of the model
+        diffs: The changes, in the order they were made to the stage
+        geometry: For models ingested with geometry, compute_geometry of the
+            updated stage, to refresh their world rows, R*Tree and instances
+
+    Raises:
+        ValueError: If the model has world rows and no geometry is given,
+            since they would be left stale, or if its tables belong to
+            another ingested model
+    """
+    table = model_table_name(model)
+    leaves_table = model_leaves_table_name(model)
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        _check_table_owner(conn, model, table)
+        if geometry is None and _has_geometry_rows(conn, table):
+            raise ValueError(f"Model {model} was ingested with geometry, its updated geometry is needed")
+        for diff in diffs:
+            upserts = [row for row in diff.upserts if row[1] not in IGNORE_ATTRS]
+            _replace_rows(conn, table, leaves_table, list(diff.deletes), upserts)
+        if geometry is not None:
+            _refresh_geometry(conn, model, geometry)
+        conn.execute(
+            f'UPDATE models SET rows = (SELECT COUNT(*) FROM "{table}"), ingested_at = ? WHERE name = ?',
+            (datetime.now(), model)
+        )
+        bump_models_version(conn)
+
+
+def find_ids(conn: sqlite3.Connection, model: str, property: str, json_path: str, op: str, value) -> List[str]:
+    """
+    Ids whose property has a leaf at json_path comparing to value, using the leaves index.
+
+    Values with more than MAX_LEAVES_PER_VALUE leaves are only partly
+    indexed, so for those (marked with TRUNCATED_JSON_PATH) the comparison is
+    made on the value itself with json_extract.
+
+    Example:
+        find_ids(conn, 'hello-wall', 'xformOp', '$.transform[3][0]', '>', 5)
+
+    Args:
+        conn: Connection from get_models_connection
+        model: Name of the model
+        property: Attribute name, e.g. 'xformOp'
+        json_path: SQLite JSON path into the attribute value
+        op: One of COMPARISONS
+        value: A number (or boolean) or a string
+
+    Returns:
+        Matching ids, in no particular order
+    """
+    if op not in COMPARISONS:
+        raise ValueError(f"Unsupported comparison: {op}")
+    if isinstance(value, str):
+        column, json_types = 'str_value', "('text')"
+    else:
+        column, json_types = 'num_value', "('integer', 'real', 'true', 'false')"
+    leaves_table = model_leaves_table_name(model)
+    query = f'''
+        SELECT id FROM "{leaves_table}"
+        WHERE property = ? AND json_path = ? AND {column} {op} ?
+        UNION
+        SELECT props.id FROM "{leaves_table}" AS truncated
+        JOIN "{model_table_name(model)}" AS props ON props.id = truncated.id AND props.property = truncated.property
+        WHERE truncated.property = ? AND truncated.json_path = ?
+            AND json_type(props.value, ?) IN {json_types} AND json_extract(props.value, ?) {op} ?
+    '''
+    params = (property, json_path, value, property, TRUNCATED_JSON_PATH, json_path, json_path, value)
+    return [row[0] for row in conn.execute(query, params)]
+
+
+def list_models(conn: sqlite3.Connection) -> List[Tuple[str, str, int, str]]:
+    """(name, table_name, rows, ingested_at) of every ingested model"""
+    return conn.execute('SELECT name, table_name, rows, ingested_at FROM models ORDER BY name').fetchall()
+
+
+def _with_connection(conn: Optional[sqlite3.Connection], work):
+    if conn is not None:
+        return work(conn)
+    conn = get_models_connection()
+    try:
+        return work(conn)
+    finally:
+        conn.close()
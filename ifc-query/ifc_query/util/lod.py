@@ -0,0 +1,110 @@
+import hashlib
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from ifc_query.util.cache import TableCache
+from ifc_query.util.mesh import MeshArrays
+
+# Grid resolutions of the simplified levels, in cells along the longest side
+# of a mesh's bounding box, coarsest first
+LOD_CELLS = (16, 64)
+
+# A simplified level is only kept if it has at most this fraction of the
+# triangles of the next finer level, so small meshes are sent as they are
+MAX_LOD_RATIO = 0.75
+
+# Bump whenever simplification changes, so cached levels are rebuilt
+LOD_VERSION = 1
+
+
+def cluster_vertices(arrays: MeshArrays, cells: int) -> Optional[MeshArrays]:
+    """
+    Simplify a mesh by vertex clustering.
+
+    Points are snapped to a grid of cubic cells, every cell's points are
+    merged into their mean, and triangles that collapse (two corners in the
+    same cell) or duplicate another one are dropped. The output size is
+    bounded by the grid, whatever the size of the input.
+
+    Args:
+        arrays: The mesh to simplify
+        cells: Number of cells along the longest side of the mesh's bounding box
+
+    Returns:
+        The simplified mesh, or None if every triangle collapsed
+    """
+    points = arrays.points.astype(np.float64)
+    lo = points.min(axis=0)
+    size = (points.max(axis=0) - lo).max()
+    if size == 0:
+        return None
+    coords = np.minimum(((points - lo) / (size / cells)).astype(np.int64), cells - 1)
+    _, cluster = np.unique((coords[:, 0] * cells + coords[:, 1]) * cells + coords[:, 2], return_inverse=True)
+    cluster = cluster.ravel()
+    n_clusters = int(cluster.max()) + 1
+    counts = np.bincount(cluster, minlength=n_clusters)
+    centers = np.stack(
+        [np.bincount(cluster, weights=points[:, axis], minlength=n_clusters) for axis in range(3)], axis=1
+    ) / counts[:, None]
+
+    triangles = cluster[arrays.indices].reshape(-1, 3)
+    triangles = triangles[
+        (triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2]) & (triangles[:, 0] != triangles[:, 2])
+    ]
+    if not len(triangles):
+        return None
+    # Keep one of the triangles over the same corners, e.g. the two sides of a thin wall
+    _, first = np.unique(np.sort(triangles, axis=1), axis=0, return_index=True)
+    triangles = triangles[np.sort(first)]
+
+    used, indices = np.unique(triangles, return_inverse=True)
+    return MeshArrays(centers[used].astype(np.float32), indices.ravel().astype(np.uint32))
+
+
+def build_lods(arrays: MeshArrays, cells: Sequence[int] = LOD_CELLS) -> List[MeshArrays]:
+    """
+    Levels of detail of a mesh, coarsest first, ending with the mesh itself.
+
+    Levels that would not be much smaller than the next finer one (see
+    MAX_LOD_RATIO) are left out.
+    """
+    lods = [arrays]
+    for n_cells in sorted(cells, reverse=True):
+        simplified = cluster_vertices(arrays, n_cells)
+        if simplified is not None and simplified.n_triangles <= MAX_LOD_RATIO * lods[0].n_triangles:
+            lods.insert(0, simplified)
+    return lods
+
+
+def lods_to_df(lods: List[MeshArrays]) -> pd.DataFrame:
+    """Levels of detail as a table of little-endian float32 points and uint32 indices, for the cache"""
+    return pd.DataFrame({
+        'level': range(len(lods)),
+        'points': [lod.points.astype('<f4').tobytes() for lod in lods],
+        'indices': [lod.indices.astype('<u4').tobytes() for lod in lods],
+    })
+
+
+def lods_from_df(df: pd.DataFrame) -> List[MeshArrays]:
+    df = df.sort_values('level')
+    return [
+        MeshArrays(np.frombuffer(points, dtype='<f4').reshape(-1, 3), np.frombuffer(indices, dtype='<u4'))
+        for points, indices in zip(df['points'], df['indices'])
+    ]
+
+
+def cached_lods(geometry_id: str, arrays: MeshArrays, cache: TableCache,
+                cells: Sequence[int] = LOD_CELLS) -> List[MeshArrays]:
+    """
+    build_lods, reusing the levels from the cache if this geometry was simplified before.
+
+    Args:
+        geometry_id: Content hash of the mesh, see mesh.mesh_key
+        arrays: The mesh, only simplified on a cache miss
+        cache: Where the levels are kept
+        cells: Grid resolutions of the simplified levels
+    """
+    key = hashlib.blake2b(f"lod:{LOD_VERSION}:{tuple(cells)}:{geometry_id}".encode(), digest_size=20).hexdigest()
+    return lods_from_df(cache.get_or_build(key, lambda: lods_to_df(build_lods(arrays, cells))))
@@ -1,10 +1,14 @@
 from pathlib import Path
+import atexit
+import logging
+import queue
 import sqlite3
-from typing import Dict
+import threading
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 import os
 import streamlit as st
-from ifc_query.db import DB_FOLDER
+from ifc_query.util.db import DB_FOLDER
 import json
 
 # Ensure data directory exists
@@ -12,11 +16,24 @@ os.makedirs(DB_FOLDER, exist_ok=True)
 
 LOG_DB_PATH = DB_FOLDER / Path('logs.db')
 
-def init_db():
+# Events waiting to be written; when full, new events are dropped rather
+# than slowing down the page that logs them
+LOG_QUEUE_SIZE = 10_000
+LOG_BATCH_SIZE = 500
+# Longest an event waits in the queue before it is written
+FLUSH_INTERVAL = 1.0
+# Longest flush() waits for the queued events to be written
+FLUSH_TIMEOUT = 5.0
+
+Row = Tuple[str, str, str, str]
+
+def init_db(conn: Optional[sqlite3.Connection] = None):
     """Initialize the logs database if it doesn't exist."""
-    conn = sqlite3.connect(LOG_DB_PATH)
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(LOG_DB_PATH)
     cursor = conn.cursor()
-    
+
     # Create logs table if it doesn't exist
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS logs (
@@ -26,42 +43,230 @@ def init_db():
             properties TEXT
         )
     ''')
-    
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_event ON logs(event, timestamp)')
+
     conn.commit()
-    conn.close()
+    if own_conn:
+        conn.close()
+
+class LogWriter:
+    """
+    Writes log events to the logs database from a background thread.
+
+    Events are put on a bounded queue and a worker thread inserts them in
+    batches, one transaction per batch, so logging an event never waits on
+    the disk. When the queue is full the event is dropped and counted, or,
+    with block=True, the caller waits up to block_timeout for room.
+
+    If the database cannot be opened the worker stops and every queued and
+    later event is dropped, so flush() never waits on a dead thread.
+    """
+
+    def __init__(self, path=LOG_DB_PATH, max_queue: int = LOG_QUEUE_SIZE, batch_size: int = LOG_BATCH_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL, block: bool = False, block_timeout: float = 0.1):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block = block
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self.written = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        # Events submitted and not yet written or dropped, for flush()
+        self._pending = 0
+        self._idle = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def submit(self, row: Row) -> bool:
+        """
+        Queue a (timestamp, event, user, properties) row for writing.
+
+        Returns:
+            False if the queue was full and the row was dropped
+        """
+        if self._closed:
+            return False
+        if self._thread is None:
+            self._start()
+        with self._idle:
+            self._pending += 1
+        try:
+            if self.block:
+                self._queue.put(row, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            self._done(1)
+            with self._lock:
+                self.dropped += 1
+                dropped = self.dropped
+            # Powers of two, so a flood of drops does not flood the log too
+            if dropped & (dropped - 1) == 0:
+                logging.log(logging.WARN, f"Log queue full, {dropped} events dropped so far")
+            return False
+        if self._closed and not self._thread.is_alive():
+            # Raced close() or a failed worker, nothing will write the row
+            self._drain()
+        return True
+
+    def _done(self, n: int) -> None:
+        with self._idle:
+            self._pending -= n
+            if self._pending <= 0:
+                self._idle.notify_all()
+
+    def _drain(self) -> None:
+        """Drop the queued rows, for when the worker is gone"""
+        n = 0
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if row is not None:
+                n += 1
+        if n:
+            with self._lock:
+                self.dropped += n
+            self._done(n)
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        conn = None
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            init_db(conn)
+            while True:
+                batch = self._next_batch()
+                self._write(conn, batch)
+                if None in batch:
+                    break
+        except Exception as e:
+            logging.log(logging.ERROR, f"Log writer stopped, events will be dropped: {e}")
+            self._closed = True
+            self._drain()
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _next_batch(self) -> List[Optional[Row]]:
+        """Wait for one row, then take whatever else is queued up to the batch size"""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, conn: sqlite3.Connection, batch: List[Optional[Row]]) -> None:
+        rows = [row for row in batch if row is not None]
+        try:
+            if rows:
+                with conn:
+                    conn.executemany(
+                        'INSERT INTO logs (timestamp, event, user, properties) VALUES (?, ?, ?, ?)', rows
+                    )
+                self.written += len(rows)
+        except sqlite3.Error as e:
+            logging.log(logging.ERROR, f"Failed to write {len(rows)} log events: {e}")
+        finally:
+            self._done(len(rows))
+
+    def flush(self, timeout: Optional[float] = FLUSH_TIMEOUT) -> bool:
+        """
+        Wait until every queued event has been written.
+
+        Returns:
+            False if events were still queued after timeout seconds
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending <= 0, timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Write the queued events and stop the worker, later events are dropped"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            # The None wakes the worker, which stops once the queue is empty
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+            self._thread.join(timeout)
+            if not self._thread.is_alive():
+                # Rows submitted while closing, after the None
+                self._drain()
+
+_writer = LogWriter()
+atexit.register(_writer.close)
 
 def log(event: str, user: str, properties: Dict):
     """
     Log an event to the database.
-    
+
+    The event is queued and written in the background, call flush() to wait
+    for it to reach the database.
+
     Args:
         event: The name of the event
         user: The username of the person performing the action
         properties: A dictionary of additional properties to log
     """
-    init_db()
-    
     timestamp = datetime.now().isoformat()
-    
-    conn = sqlite3.connect(LOG_DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        'INSERT INTO logs (timestamp, event, user, properties) VALUES (?, ?, ?, ?)',
-        (timestamp, event, user, json.dumps(properties))
-    )
-    
-    conn.commit()
-    conn.close()
+    _writer.submit((timestamp, event, user, json.dumps(properties)))
+
+def flush(timeout: Optional[float] = FLUSH_TIMEOUT) -> bool:
+    """Wait until every logged event has been written to the database, see LogWriter.flush"""
+    return _writer.flush(timeout)
 
 def st_log(event: str, properties: Dict):
     """
     Log an event using the current Streamlit user.
-    
+
     Args:
         event: The name of the event
         properties: A dictionary of additional properties to log
     """
-    # Get username from Streamlit session state
-    user = st.session_state.get('username', 'unknown')
+    # Get username from Streamlit session state, or the logged in GitHub user
+    user = st.session_state.get('username') or (st.session_state.get('user_data') or {}).get('login', 'unknown')
     log(event, user, properties)
+
+def slowest_queries(limit: int = 50, since: Optional[str] = None) -> List[Tuple[str, str, dict]]:
+    """
+    The slowest queries recorded with the 'query' event.
+
+    Args:
+        limit: Maximum number of queries to return
+        since: Only queries logged at or after this ISO timestamp
+
+    Returns:
+        (timestamp, user, properties) tuples, slowest first
+    """
+    flush()
+    conn = sqlite3.connect(LOG_DB_PATH)
+    try:
+        init_db(conn)
+        rows = conn.execute('''
+            SELECT timestamp, user, properties FROM logs
+            WHERE event = 'query' AND timestamp >= ?
+            ORDER BY json_extract(properties, '$.duration_ms') DESC
+            LIMIT ?
+        ''', (since or '', limit)).fetchall()
+    finally:
+        conn.close()
+    return [(timestamp, user, json.loads(properties)) for timestamp, user, properties in rows]
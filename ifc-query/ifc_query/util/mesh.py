@@ -0,0 +1,177 @@
+import hashlib
+from dataclasses import dataclass
+from logging import log, INFO, WARN
+from typing import Dict, Iterable, Iterator, Optional, Set
+
+import numpy as np
+
+MESH_ATTR = 'UsdGeom:Mesh'
+
+
+@dataclass
+class MeshArrays:
+    """A triangle mesh as typed arrays, ready to be sent to a GPU"""
+    points: np.ndarray   # (n, 3) float32
+    indices: np.ndarray  # (3 * triangles,) uint32
+
+    @property
+    def n_triangles(self) -> int:
+        return len(self.indices) // 3
+
+
+def triangulate(face_vertex_indices: np.ndarray, face_vertex_counts: Optional[np.ndarray]) -> np.ndarray:
+    """
+    Fan-triangulate polygon faces.
+
+    Args:
+        face_vertex_indices: Vertex indices of all faces, concatenated
+        face_vertex_counts: Number of vertices of each face, None if all faces are triangles
+
+    Returns:
+        Vertex indices of the triangles, three per triangle
+
+    Raises:
+        ValueError: If the face sizes are negative or do not add up to the
+            number of indices
+    """
+    if face_vertex_counts is not None and (
+        face_vertex_counts.ndim != 1 or (face_vertex_counts < 0).any()
+        or face_vertex_counts.sum() != len(face_vertex_indices)
+    ):
+        raise ValueError("Mesh faceVertexCounts do not add up to its faceVertexIndices")
+    if face_vertex_counts is None or np.all(face_vertex_counts == 3):
+        return face_vertex_indices
+    counts = face_vertex_counts[face_vertex_counts >= 3]
+    starts = np.concatenate(([0], np.cumsum(face_vertex_counts)[:-1]))[face_vertex_counts >= 3]
+    # Triangle k of a face starting at s is (s, s + k + 1, s + k + 2)
+    n_triangles = counts - 2
+    face_start = np.repeat(starts, n_triangles)
+    k = np.arange(n_triangles.sum()) - np.repeat(np.cumsum(n_triangles) - n_triangles, n_triangles)
+    corners = np.stack([face_start, face_start + k + 1, face_start + k + 2], axis=1)
+    return face_vertex_indices[corners.ravel()]
+
+
+def mesh_arrays(mesh: dict) -> Optional[MeshArrays]:
+    """
+    Convert a UsdGeom:Mesh attribute value to typed arrays.
+
+    Args:
+        mesh: The decoded attribute, with 'points' and 'faceVertexIndices'
+            and optionally 'faceVertexCounts'
+
+    Returns:
+        The mesh, or None if it has no points or faces
+    """
+    if not isinstance(mesh, dict) or not mesh.get('points') or not mesh.get('faceVertexIndices'):
+        return None
+    points = np.asarray(mesh['points'], dtype=np.float32).reshape(-1, 3)
+    indices = np.asarray(mesh['faceVertexIndices'], dtype=np.uint32)
+    counts = mesh.get('faceVertexCounts')
+    indices = triangulate(indices, None if counts is None else np.asarray(counts, dtype=np.int64))
+    if len(indices) % 3 or (len(indices) and indices.max() >= len(points)):
+        raise ValueError("Mesh has faces referencing missing points")
+    return MeshArrays(points, indices)
+
+
+def buffer_id(data: np.ndarray) -> str:
+    """Content hash of an array and its type, usable as a buffer id and a strong ETag"""
+    digest = hashlib.blake2b(f"{data.dtype.str}:{data.shape}".encode(), digest_size=16)
+    digest.update(np.ascontiguousarray(data).data)
+    return digest.hexdigest()
+
+
+def _mesh_field(mesh: dict, name: str, dtype, width: int = 1) -> np.ndarray:
+    """A field of a mesh value as a flat array, checking it has rows of the given width"""
+    try:
+        array = np.asarray(mesh[name], dtype=dtype)
+    except (TypeError, ValueError, OverflowError) as e:
+        raise ValueError(f"Mesh {name} is not a regular array of numbers") from e
+    if array.ndim != (1 if width == 1 else 2) or (width > 1 and array.shape[1] != width):
+        raise ValueError(f"Mesh {name} has shape {array.shape}")
+    return array
+
+
+def mesh_key(mesh: dict) -> Optional[str]:
+    """
+    Content hash of a UsdGeom:Mesh value's points and faces, None if it has none.
+
+    Identical geometry has the same key whatever prim or class it is under.
+
+    Raises:
+        ValueError: If points are not (n, 3) or the face fields are not flat
+            lists of integers
+    """
+    if not isinstance(mesh, dict) or not mesh.get('points') or not mesh.get('faceVertexIndices'):
+        return None
+    digest = hashlib.blake2b(digest_size=16)
+    for name, dtype, width in (('points', np.float64, 3), ('faceVertexIndices', np.int64, 1),
+                               ('faceVertexCounts', np.int64, 1)):
+        if mesh.get(name) is None:
+            continue
+        digest.update(name.encode())
+        digest.update(np.ascontiguousarray(_mesh_field(mesh, name, dtype, width)).data)
+    return digest.hexdigest()
+
+
+class MeshInterner:
+    """
+    Collapses identical mesh values to a single shared dict as IFCX objects are parsed.
+
+    Models often repeat the same window or door geometry under different
+    class names. Once interned, the copies are freed, and everything keyed by
+    the identity of a mesh value (composition, bounds, buffers) handles each
+    geometry once.
+    """
+
+    def __init__(self):
+        self.unique: Dict[str, dict] = {}
+        self.n_meshes = 0
+        # Ids of the shared copies, which unique keeps alive, so meshes
+        # interned again (e.g. by a worker process, then across layers) are
+        # not hashed twice
+        self._shared: Set[int] = set()
+
+    @property
+    def dedup_ratio(self) -> float:
+        """Mesh values seen per unique geometry"""
+        return self.n_meshes / len(self.unique) if self.unique else 1.0
+
+    def intern(self, mesh: dict) -> dict:
+        """The shared copy of a mesh value"""
+        self.n_meshes += 1
+        if id(mesh) in self._shared:
+            return mesh
+        key = mesh_key(mesh)
+        if key is None:
+            return mesh
+        shared = self.unique.setdefault(key, mesh)
+        self._shared.add(id(shared))
+        return shared
+
+    def intern_object(self, obj: dict) -> dict:
+        """
+        Intern the mesh values of an IFCX object and its children, in place.
+
+        Malformed meshes (see mesh_key) are removed from the object with a
+        warning, so nothing downstream has to handle them.
+        """
+        attributes = obj.get('attributes')
+        if isinstance(attributes, dict) and isinstance(attributes.get(MESH_ATTR), dict):
+            try:
+                attributes[MESH_ATTR] = self.intern(attributes[MESH_ATTR])
+            except ValueError as e:
+                log(WARN, f"Skipping the mesh of {obj.get('name')}: {e}")
+                del attributes[MESH_ATTR]
+        for child in obj.get('children') or ():
+            if isinstance(child, dict):
+                self.intern_object(child)
+        return obj
+
+    def intern_objects(self, objects: Iterable) -> Iterator:
+        """Intern the mesh values of a layer's objects as they are read"""
+        for obj in objects:
+            yield self.intern_object(obj) if isinstance(obj, dict) else obj
+
+    def report(self) -> None:
+        log(INFO, f"{self.n_meshes} meshes, {len(self.unique)} unique geometries "
+                  f"(dedup ratio {self.dedup_ratio:.1f}x)")
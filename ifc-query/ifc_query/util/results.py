@@ -0,0 +1,285 @@
+import csv
+import io
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import IO, Iterable, Iterator, List, Optional, Tuple
+
+PREVIEW_ROWS = 1000
+FETCH_SIZE = 10_000
+QUERY_TIMEOUT = 30.0
+EXPORT_TIMEOUT = 300.0
+MAX_EXPORT_ROWS = 5_000_000
+# Exports are kept in memory up to this size, and spill to a temporary file beyond it
+SPOOL_SIZE = 32 << 20
+# SQLite virtual machine instructions between two deadline checks
+PROGRESS_STEPS = 10_000
+
+
+class QueryTimeoutError(sqlite3.OperationalError):
+    """A query was interrupted for running longer than its time limit"""
+
+
+@contextmanager
+def time_limit(conn: sqlite3.Connection, seconds: Optional[float]):
+    """
+    Interrupt any statement on conn that is still running after the given
+    number of seconds, raising QueryTimeoutError.
+
+    The deadline covers everything done on conn inside the block, including
+    fetching rows from cursors opened in it.
+    """
+    if seconds is None:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    conn.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_STEPS)
+    try:
+        yield
+    except sqlite3.OperationalError as e:
+        if time.monotonic() > deadline and 'interrupt' in str(e):
+            raise QueryTimeoutError(f"Query interrupted after {seconds:g}s") from e
+        raise
+    finally:
+        conn.set_progress_handler(None, PROGRESS_STEPS)
+
+
+def _columns(cursor: sqlite3.Cursor) -> List[str]:
+    return [column[0] for column in cursor.description or ()]
+
+
+def explain(conn: sqlite3.Connection, query: str) -> List[str]:
+    """
+    The EXPLAIN QUERY PLAN of a query, one line per step, indented by depth.
+
+    Returns:
+        The plan, or an empty list if the statement cannot be explained
+    """
+    try:
+        steps = conn.execute(f"EXPLAIN QUERY PLAN {query}").fetchall()
+    except sqlite3.Error:
+        return []
+    depths = {0: -1}
+    plan = []
+    for step_id, parent_id, _, detail in steps:
+        depths[step_id] = depths.get(parent_id, -1) + 1
+        plan.append('  ' * depths[step_id] + detail)
+    return plan
+
+
+def full_scans(plan: List[str]) -> List[str]:
+    """
+    Tables a query plan reads in full, e.g. 'props_hello_wall' for 'SCAN props_hello_wall'.
+
+    Scans of a covering index are included, since they still visit every row.
+    """
+    tables = []
+    for step in plan:
+        words = step.split()
+        if len(words) >= 2 and words[0] == 'SCAN' and words[1] not in ('CONSTANT', 'SUBQUERY'):
+            tables.append(words[1])
+    return tables
+
+
+def preview(conn: sqlite3.Connection, query: str, n_rows: int = PREVIEW_ROWS,
+            timeout: Optional[float] = QUERY_TIMEOUT) -> Tuple[List[str], List[tuple], bool]:
+    """
+    Run a query and fetch only its first rows.
+
+    Args:
+        conn: Database connection
+        query: A single SQL statement
+        n_rows: Number of rows to fetch
+        timeout: Seconds before the query is interrupted, None for no limit
+
+    Returns:
+        (columns, rows, truncated), truncated being True if the query has more rows
+    """
+    with time_limit(conn, timeout):
+        cursor = conn.execute(query)
+        try:
+            rows = cursor.fetchmany(n_rows + 1)
+        finally:
+            cursor.close()
+    return _columns(cursor), rows[:n_rows], len(rows) > n_rows
+
+
+def count_rows(conn: sqlite3.Connection, query: str, timeout: Optional[float] = QUERY_TIMEOUT) -> Optional[int]:
+    """
+    Count the rows of a SELECT query in SQLite, without fetching them.
+
+    Returns:
+        The number of rows, or None if the statement cannot be counted
+        (e.g. it is not a SELECT) or counting runs out of time
+    """
+    count_query = f"SELECT COUNT(*) FROM ({query.strip().rstrip(';')})"
+    try:
+        with time_limit(conn, timeout):
+            return conn.execute(count_query).fetchone()[0]
+    except sqlite3.Error:
+        return None
+
+
+def _fetch_batches(cursor: sqlite3.Cursor, batch_size: int, max_rows: Optional[int]) -> Iterator[List[tuple]]:
+    n_rows = 0
+    while max_rows is None or n_rows < max_rows:
+        size = batch_size if max_rows is None else min(batch_size, max_rows - n_rows)
+        rows = cursor.fetchmany(size)
+        if not rows:
+            break
+        n_rows += len(rows)
+        yield rows
+
+
+def iter_batches(conn: sqlite3.Connection, query: str, batch_size: int = FETCH_SIZE,
+                 max_rows: Optional[int] = MAX_EXPORT_ROWS,
+                 timeout: Optional[float] = EXPORT_TIMEOUT) -> Iterator[Tuple[List[str], List[tuple]]]:
+    """
+    Stream the rows of a query with fetchmany.
+
+    Args:
+        conn: Database connection
+        query: A single SQL statement
+        batch_size: Rows per batch
+        max_rows: Stop after this many rows, None for no cap
+        timeout: Seconds before the query is interrupted, None for no limit
+
+    Yields:
+        (columns, rows) for each batch of at most batch_size rows
+    """
+    with time_limit(conn, timeout):
+        cursor = conn.execute(query)
+        try:
+            columns = _columns(cursor)
+            for rows in _fetch_batches(cursor, batch_size, max_rows):
+                yield columns, rows
+        finally:
+            cursor.close()
+
+
+def export_csv(conn: sqlite3.Connection, query: str, batch_size: int = FETCH_SIZE,
+               max_rows: Optional[int] = MAX_EXPORT_ROWS, timeout: Optional[float] = EXPORT_TIMEOUT) -> IO[bytes]:
+    """
+    Write the result of a query as UTF-8 CSV to a spooled temporary file,
+    with a header row even when there are no rows. Arguments are as for
+    iter_batches.
+
+    Returns:
+        The file, rewound to the start
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    text = io.TextIOWrapper(spool, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    with time_limit(conn, timeout):
+        cursor = conn.execute(query)
+        try:
+            writer.writerow(_columns(cursor))
+            for rows in _fetch_batches(cursor, batch_size, max_rows):
+                writer.writerows(rows)
+        finally:
+            cursor.close()
+    text.flush()
+    # Hand the binary file back without closing it along with the wrapper
+    text.detach()
+    spool.seek(0)
+    return spool
+
+
+def _arrow_type(values: list):
+    """
+    The Arrow type of a column from its first batch of values.
+
+    SQLite columns are not typed, so this is a guess: integers mixed with
+    reals are widened to float64, and columns that are all NULL or mix other
+    types are written as strings, so later batches with values still fit.
+    """
+    import pyarrow as pa
+
+    kinds = {type(value) for value in values if value is not None}
+    if kinds == {int}:
+        return pa.int64()
+    if kinds and kinds <= {int, float}:
+        return pa.float64()
+    if kinds == {bytes}:
+        return pa.binary()
+    return pa.string()
+
+
+def _arrow_column(values: list, arrow_type, column: str):
+    import pyarrow as pa
+
+    if pa.types.is_string(arrow_type):
+        return pa.array([value if value is None or isinstance(value, str) else str(value) for value in values],
+                        type=arrow_type)
+    try:
+        return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        pass
+    try:
+        # e.g. reals in a column first seen with integers only
+        return pa.array(values).cast(arrow_type, safe=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+        raise ValueError(f"Column {column} mixes values that cannot be written as {arrow_type}") from e
+
+
+def write_parquet(out, columns: List[str], batches: Iterable[List[tuple]]) -> int:
+    """
+    Write batches of rows as Parquet, one row group per batch.
+
+    The schema has one field per column, in order, so duplicate names (e.g.
+    two id columns from a join) are all kept; types are taken from the first
+    batch, see _arrow_type. Without any rows, the file is still written with
+    the columns as strings.
+
+    Args:
+        out: Binary file to write to
+        columns: Column names, e.g. from cursor.description
+        batches: Lists of row tuples
+
+    Returns:
+        The number of rows written
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = None
+    writer = None
+    n_rows = 0
+    try:
+        for rows in batches:
+            if not rows:
+                continue
+            values = [list(column) for column in zip(*rows)]
+            if schema is None:
+                schema = pa.schema([pa.field(name, _arrow_type(column)) for name, column in zip(columns, values)])
+                writer = pq.ParquetWriter(out, schema)
+            arrays = [_arrow_column(column, field.type, field.name) for column, field in zip(values, schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            n_rows += len(rows)
+        if writer is None:
+            writer = pq.ParquetWriter(out, pa.schema([pa.field(name, pa.string()) for name in columns]))
+    finally:
+        if writer is not None:
+            writer.close()
+    return n_rows
+
+
+def export_parquet(conn: sqlite3.Connection, query: str, batch_size: int = FETCH_SIZE,
+                   max_rows: Optional[int] = MAX_EXPORT_ROWS, timeout: Optional[float] = EXPORT_TIMEOUT) -> IO[bytes]:
+    """
+    Write the result of a query as Parquet to a spooled temporary file, see
+    write_parquet. Arguments are as for iter_batches.
+
+    Returns:
+        The file, rewound to the start
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    with time_limit(conn, timeout):
+        cursor = conn.execute(query)
+        try:
+            write_parquet(spool, _columns(cursor), _fetch_batches(cursor, batch_size, max_rows))
+        finally:
+            cursor.close()
+    spool.seek(0)
+    return spool
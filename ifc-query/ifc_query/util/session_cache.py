@@ -0,0 +1,180 @@
+import threading
+import time
+from collections import OrderedDict
+from logging import log, WARN
+from typing import Callable, Dict, Hashable, Optional
+
+import requests
+
+GITHUB_USER_URL = 'https://api.github.com/user'
+UPSTREAM_TIMEOUT = 10
+
+# Sessions are short-lived in the cache so that a session deleted by another
+# server process is not honoured for long; user data is rechecked with the
+# auth server every 15 minutes
+SESSION_TTL = 5 * 60
+USER_TTL = 15 * 60
+MAX_ENTRIES = 4096
+
+UserFetcher = Callable[[str], Optional[dict]]
+
+
+class _Flight:
+    """A load in progress, which concurrent callers for the same key wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class TTLCache:
+    """
+    A process-wide, thread-safe cache with per-entry expiry and LRU eviction.
+
+    Concurrent misses for the same key are collapsed: the first caller loads
+    the value and the others wait for its result. None is never cached, so a
+    failed lookup is retried on the next call.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = MAX_ENTRIES, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable):
+        """The cached value for key, or None if it is missing or expired"""
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key: Hashable):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires <= self.clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value) -> None:
+        with self._lock:
+            self._put(key, value)
+
+    def _put(self, key: Hashable, value) -> None:
+        if value is None:
+            return
+        self._entries[key] = (self.clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_or_load(self, key: Hashable, load: Callable[[], object]):
+        """
+        The cached value for key, calling load() on a miss.
+
+        Args:
+            key: Cache key
+            load: Fetches the value; only one call per key runs at a time
+
+        Returns:
+            The cached or loaded value
+        """
+        with self._lock:
+            value = self._get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = load()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                # An invalidation while loading orphans the flight, so its
+                # possibly stale result is handed to waiters but not cached
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                    if flight.error is None:
+                        self._put(key, flight.value)
+            flight.done.set()
+        return flight.value
+
+    def pop(self, key: Hashable):
+        """Remove key, returning its cached value (even if expired) or None"""
+        with self._lock:
+            self._flights.pop(key, None)
+            entry = self._entries.pop(key, None)
+            return entry[1] if entry is not None else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._flights.clear()
+
+
+# session_id -> the session dict from db.get_session
+SESSIONS = TTLCache(SESSION_TTL)
+# access token -> user data from the auth server
+USERS = TTLCache(USER_TTL)
+
+
+def fetch_github_user(access_token: str) -> Optional[dict]:
+    """Fetch the user for an access token from GitHub, None if the token is rejected"""
+    headers = {'Authorization': f'token {access_token}'}
+    response = requests.get(GITHUB_USER_URL, headers=headers, timeout=UPSTREAM_TIMEOUT)
+    if response.status_code != 200:
+        log(WARN, f"Auth server rejected token with status {response.status_code}")
+        return None
+    return response.json()
+
+
+_user_fetcher: UserFetcher = fetch_github_user
+
+
+def set_user_fetcher(fetcher: UserFetcher) -> UserFetcher:
+    """
+    Replace the upstream call that resolves an access token to user data,
+    e.g. with a local stub in tests. Clears cached users.
+
+    Returns:
+        The previous fetcher, so it can be restored
+    """
+    global _user_fetcher
+    previous, _user_fetcher = _user_fetcher, fetcher
+    USERS.clear()
+    return previous
+
+
+def fetch_user(access_token: str) -> Optional[dict]:
+    """Resolve an access token with the current upstream fetcher, bypassing the cache"""
+    return _user_fetcher(access_token)
+
+
+def invalidate_session(session_id: str) -> None:
+    """Forget a session and the user data cached for its token"""
+    session = SESSIONS.pop(session_id)
+    if session is not None:
+        USERS.pop(session['access_token'])
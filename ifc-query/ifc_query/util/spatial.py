@@ -0,0 +1,260 @@
+import fnmatch
+import heapq
+import math
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ifc_query.util.geometry import Geometry
+
+# Maximum number of boxes in a leaf of the hierarchy
+LEAF_SIZE = 8
+
+# Tests a batch of boxes, given as (n, 3) minimum and maximum corners
+BoxTest = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+
+def box_distance(bbox_min: np.ndarray, bbox_max: np.ndarray, point: Sequence[float]) -> np.ndarray:
+    """Euclidean distance from a point to each of a batch of boxes, 0 inside them"""
+    point = np.asarray(point, dtype=np.float64)
+    gap = np.maximum(np.maximum(bbox_min - point, point - bbox_max), 0)
+    return np.sqrt((gap ** 2).sum(axis=-1))
+
+
+def bbox_distance(min_x, min_y, min_z, max_x, max_y, max_z, x, y, z) -> Optional[float]:
+    """Scalar box_distance, registered as an SQL function by register_functions"""
+    if None in (min_x, min_y, min_z, max_x, max_y, max_z, x, y, z):
+        return None
+    gaps = (max(lo - p, p - hi, 0.0) for lo, hi, p in ((min_x, max_x, x), (min_y, max_y, y), (min_z, max_z, z)))
+    return math.sqrt(sum(gap * gap for gap in gaps))
+
+
+def register_functions(conn) -> None:
+    """
+    Make the spatial helpers callable from SQL on a connection.
+
+    bbox_distance(min_x, min_y, min_z, max_x, max_y, max_z, x, y, z) is the
+    distance from the point (x, y, z) to a box, e.g. for radius filters and
+    nearest-neighbour ordering on a model's _rtree table.
+    """
+    conn.create_function('bbox_distance', 9, bbox_distance, deterministic=True)
+
+
+class BVH:
+    """
+    A bounding-volume hierarchy over axis-aligned boxes.
+
+    Built top-down by splitting the boxes at the median of their centers
+    along the widest axis, down to leaves of at most LEAF_SIZE boxes. Nodes
+    are stored in flat arrays, and queries walk the tree one level at a time
+    with the boxes of the whole level tested in a single NumPy operation.
+
+    Queries return indices into the boxes the hierarchy was built from;
+    ids, when given, name those boxes (e.g. prim paths).
+    """
+
+    def __init__(self, bbox_min: np.ndarray, bbox_max: np.ndarray, ids: Optional[List[str]] = None,
+                 leaf_size: int = LEAF_SIZE):
+        self.bbox_min = np.asarray(bbox_min, dtype=np.float64).reshape(-1, 3)
+        self.bbox_max = np.asarray(bbox_max, dtype=np.float64).reshape(-1, 3)
+        if self.bbox_min.shape != self.bbox_max.shape:
+            raise ValueError("bbox_min and bbox_max must have the same shape")
+        if np.isnan(self.bbox_min).any() or np.isnan(self.bbox_max).any():
+            raise ValueError("Cannot index empty (NaN) boxes")
+        if ids is not None and len(ids) != len(self.bbox_min):
+            raise ValueError("ids must have one entry per box")
+        self.ids = ids
+        self.leaf_size = leaf_size
+        self._build()
+
+    def __len__(self) -> int:
+        return len(self.bbox_min)
+
+    def _build(self) -> None:
+        n = len(self.bbox_min)
+        centers = (self.bbox_min + self.bbox_max) / 2
+        order = np.arange(n)
+        # A binary tree over n boxes has at most 2n - 1 nodes
+        size = max(2 * n - 1, 0)
+        self.node_min = np.empty((size, 3))
+        self.node_max = np.empty((size, 3))
+        self.children = np.full((size, 2), -1, dtype=np.int64)
+        self.node_leaf = np.full(size, -1, dtype=np.int64)
+        leaves = []
+        n_nodes = 1 if n else 0
+        # (node, start, end) of the ranges of order still to be split
+        pending = [(0, 0, n)] if n else []
+        while pending:
+            node, start, end = pending.pop()
+            items = order[start:end]
+            self.node_min[node] = self.bbox_min[items].min(axis=0)
+            self.node_max[node] = self.bbox_max[items].max(axis=0)
+            if end - start <= self.leaf_size:
+                self.node_leaf[node] = len(leaves)
+                leaves.append(items)
+                continue
+            spread = centers[items].max(axis=0) - centers[items].min(axis=0)
+            axis = int(np.argmax(spread))
+            middle = (end - start) // 2
+            order[start:end] = items[np.argpartition(centers[items, axis], middle)]
+            self.children[node] = (n_nodes, n_nodes + 1)
+            pending.append((n_nodes, start, start + middle))
+            pending.append((n_nodes + 1, start + middle, end))
+            n_nodes += 2
+
+        self.node_min = self.node_min[:n_nodes]
+        self.node_max = self.node_max[:n_nodes]
+        self.children = self.children[:n_nodes]
+        self.node_leaf = self.node_leaf[:n_nodes]
+        # Leaves padded to leaf_size with -1, so they can be gathered as a block
+        self.leaf_items = np.full((len(leaves), self.leaf_size), -1, dtype=np.int64)
+        for i, items in enumerate(leaves):
+            self.leaf_items[i, :len(items)] = items
+
+    def _search(self, test: BoxTest) -> np.ndarray:
+        """Indices of the boxes passing test, pruning nodes that fail it"""
+        if not len(self):
+            return np.empty(0, dtype=np.int64)
+        found = []
+        frontier = np.array([0])
+        while frontier.size:
+            frontier = frontier[test(self.node_min[frontier], self.node_max[frontier])]
+            leaf = self.node_leaf[frontier] >= 0
+            items = self.leaf_items[self.node_leaf[frontier[leaf]]].ravel()
+            items = items[items >= 0]
+            found.append(items[test(self.bbox_min[items], self.bbox_max[items])])
+            frontier = self.children[frontier[~leaf]].ravel()
+        return np.sort(np.concatenate(found))
+
+    def query_box(self, lo: Sequence[float], hi: Sequence[float]) -> np.ndarray:
+        """Indices of the boxes intersecting the box from lo to hi (touching counts)"""
+        lo = np.asarray(lo, dtype=np.float64)
+        hi = np.asarray(hi, dtype=np.float64)
+        return self._search(lambda bmin, bmax: ((bmin <= hi) & (bmax >= lo)).all(axis=1))
+
+    def query_radius(self, point: Sequence[float], radius: float) -> np.ndarray:
+        """Indices of the boxes within radius of a point"""
+        return self._search(lambda bmin, bmax: box_distance(bmin, bmax, point) <= radius)
+
+    def nearest(self, point: Sequence[float], k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The k boxes closest to a point, by best-first search.
+
+        Returns:
+            Indices of the boxes and their distances to the point, closest first
+        """
+        indices, distances = [], []
+        if not len(self) or k <= 0:
+            return np.array(indices, dtype=np.int64), np.array(distances)
+        # Entries are (distance, is_box, index): at equal distances nodes are
+        # expanded before boxes are reported, so results are exact
+        heap = [(0.0, False, 0)]
+        while heap and len(indices) < k:
+            distance, is_box, index = heapq.heappop(heap)
+            if is_box:
+                indices.append(index)
+                distances.append(distance)
+                continue
+            leaf = self.node_leaf[index]
+            if leaf >= 0:
+                items = self.leaf_items[leaf]
+                items = items[items >= 0]
+                entries = zip(box_distance(self.bbox_min[items], self.bbox_max[items], point).tolist(),
+                              [True] * len(items), items.tolist())
+            else:
+                nodes = self.children[index]
+                entries = zip(box_distance(self.node_min[nodes], self.node_max[nodes], point).tolist(),
+                              [False, False], nodes.tolist())
+            for entry in entries:
+                heapq.heappush(heap, entry)
+        return np.array(indices, dtype=np.int64), np.array(distances)
+
+    def clash_pairs(self, other: Optional['BVH'] = None, tolerance: float = 0.0) -> np.ndarray:
+        """
+        Broad-phase clash detection: every pair of intersecting boxes.
+
+        Both hierarchies are walked together, one level of node pairs at a
+        time, only descending into pairs whose bounds intersect.
+
+        Args:
+            other: The hierarchy of the second set of boxes, defaults to this one
+            tolerance: Also report boxes closer than this (a clearance check)
+
+        Returns:
+            (n, 2) array of (index in this hierarchy, index in other), sorted;
+            for a self-join each pair is reported once with the lower index first
+        """
+        self_join = other is None
+        other = self if self_join else other
+        if not len(self) or not len(other):
+            return np.empty((0, 2), dtype=np.int64)
+
+        def overlap(a_min, a_max, b_min, b_max):
+            return ((a_min - tolerance <= b_max) & (b_min <= a_max + tolerance)).all(axis=-1)
+
+        found = []
+        pairs = np.array([[0, 0]])
+        while pairs.size:
+            a, b = pairs[:, 0], pairs[:, 1]
+            pairs = pairs[overlap(self.node_min[a], self.node_max[a], other.node_min[b], other.node_max[b])]
+            a, b = pairs[:, 0], pairs[:, 1]
+            a_leaf = self.node_leaf[a] >= 0
+            b_leaf = other.node_leaf[b] >= 0
+
+            # Pairs of leaves: test every box of one against every box of the other
+            both = a_leaf & b_leaf
+            items_a = self.leaf_items[self.node_leaf[a[both]]][:, :, None]
+            items_b = other.leaf_items[other.node_leaf[b[both]]][:, None, :]
+            items_a, items_b = np.broadcast_arrays(items_a, items_b)
+            items_a, items_b = items_a.ravel(), items_b.ravel()
+            valid = (items_a >= 0) & (items_b >= 0)
+            items_a, items_b = items_a[valid], items_b[valid]
+            hit = overlap(self.bbox_min[items_a], self.bbox_max[items_a], other.bbox_min[items_b], other.bbox_max[items_b])
+            found.append(np.stack([items_a[hit], items_b[hit]], axis=1))
+
+            # Otherwise descend into the larger node, or the one that is not a leaf
+            volume_a = np.prod(self.node_max[a] - self.node_min[a], axis=1)
+            volume_b = np.prod(other.node_max[b] - other.node_min[b], axis=1)
+            split_a = ~a_leaf & (b_leaf | (volume_a >= volume_b))
+            split_b = ~both & ~split_a
+            children_a = self.children[a[split_a]]
+            children_b = other.children[b[split_b]]
+            pairs = np.concatenate([
+                np.stack([children_a[:, 0], b[split_a]], axis=1),
+                np.stack([children_a[:, 1], b[split_a]], axis=1),
+                np.stack([a[split_b], children_b[:, 0]], axis=1),
+                np.stack([a[split_b], children_b[:, 1]], axis=1),
+            ])
+
+        result = np.concatenate(found)
+        if self_join:
+            result = result[result[:, 0] < result[:, 1]]
+        return np.unique(result, axis=0)
+
+
+def geometry_bvh(geometry: Geometry, own_meshes_only: bool = False, pattern: Optional[str] = None) -> BVH:
+    """
+    Index the world bounding boxes of the prims of a stage, with their paths as ids.
+
+    Args:
+        geometry: From geometry.compute_geometry
+        own_meshes_only: Only index prims with a mesh of their own, leaving out
+            the boxes of groups such as storeys, which enclose their contents
+        pattern: Only index prims whose path matches this glob, e.g. '*/Window*'
+
+    Returns:
+        The hierarchy, whose ids are the paths of the indexed prims
+    """
+    selected = geometry.has_bbox()
+    if own_meshes_only:
+        selected &= geometry.has_mesh
+    if pattern is not None:
+        selected &= np.array([fnmatch.fnmatchcase(path, pattern) for path in geometry.hierarchy.paths], dtype=bool)
+    indices = np.flatnonzero(selected)
+    paths = [geometry.hierarchy.paths[i] for i in indices]
+    return BVH(geometry.bbox_min[indices], geometry.bbox_max[indices], ids=paths)
+
+
+def is_ancestor_pair(path_a: str, path_b: str) -> bool:
+    """Whether one prim path contains the other, e.g. a window and its body"""
+    return path_b.startswith(path_a + '/') or path_a.startswith(path_b + '/')
@@ -0,0 +1,269 @@
+import codecs
+import json
+import re
+from typing import IO, Collection, Iterator, Optional, Union
+
+CHUNK_SIZE = 1 << 16
+# How far into a top-level object to look for the names of skipped attributes
+LOOKAHEAD = 1 << 10
+
+_DECODER = json.JSONDecoder()
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRING = re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL)
+_BRACKET = re.compile(r'[\[\]{}]')
+_SCALAR = re.compile(r'[^,\]}\s]+')
+
+
+class _Reader:
+    """
+    Sliding text window over a (binary or text) file.
+
+    Consumed text is dropped from the front of the buffer on every refill,
+    unless a mark is set, in which case everything from the mark onwards is
+    kept so the marked value can be decoded once its end has been found.
+    """
+
+    def __init__(self, fp: IO, chunk_size: int):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self.buf = ''
+        self.pos = 0
+        self.mark: Optional[int] = None
+        self.eof = False
+
+    def fill(self) -> bool:
+        """Read the next chunk into the buffer. Returns False at end of file."""
+        if self.eof:
+            return False
+        cut = self.pos if self.mark is None else self.mark
+        if cut:
+            self.buf = self.buf[cut:]
+            self.pos -= cut
+            if self.mark is not None:
+                self.mark -= cut
+        # Grow reads with the retained text so keeping a large value stays linear
+        chunk = self.fp.read(max(self.chunk_size, len(self.buf)))
+        if isinstance(chunk, bytes):
+            chunk = self.decoder.decode(chunk, final=not chunk)
+        elif not isinstance(chunk, str):
+            raise TypeError(f"Cannot read IFCX data from {type(chunk).__name__}")
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf += chunk
+        return True
+
+    def error(self, message: str) -> json.JSONDecodeError:
+        return json.JSONDecodeError(message, self.buf, self.pos)
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character ('' at end of file)."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise self.error(f"Expecting '{char}'")
+        self.pos += 1
+
+    def _string_end(self) -> int:
+        while True:
+            match = _STRING.match(self.buf, self.pos)
+            if match:
+                return match.end()
+            if not self.fill():
+                raise self.error("Unterminated string")
+
+    def _scalar_end(self) -> int:
+        while True:
+            match = _SCALAR.match(self.buf, self.pos)
+            if match is None:
+                raise self.error("Expecting value")
+            if match.end() < len(self.buf) or not self.fill():
+                return match.end()
+
+    def _advance_value(self, in_object: bool = True) -> None:
+        """
+        Move past the value at the cursor without decoding it.
+
+        Inside an object, a value can only be followed by ',' before the next
+        key's opening quote, so the brackets between two quotes can be counted
+        in bulk: if the depth stays positive across that stretch, the value has
+        not ended yet. That no longer holds once the enclosing object may close
+        within the stretch, since whatever follows it (e.g. a top-level entry
+        that is an array) can open brackets again, so stretches with a '}' are
+        walked bracket by bracket, as is the stretch where the value ends. The
+        long runs of numbers in mesh arrays hold no '}' and are still counted
+        in bulk.
+        """
+        char = self.peek()
+        if char == '':
+            raise self.error("Expecting value")
+        if char == '"':
+            self.pos = self._string_end()
+            return
+        if char not in '[{':
+            self.pos = self._scalar_end()
+            return
+
+        depth = 0
+        while True:
+            buf, pos = self.buf, self.pos
+            quote = buf.find('"', pos)
+            end = len(buf) if quote < 0 else quote
+            net = (buf.count('[', pos, end) + buf.count('{', pos, end)
+                   - buf.count(']', pos, end) - buf.count('}', pos, end))
+            if in_object and depth + net > 0 and buf.find('}', pos, end) < 0:
+                depth += net
+            else:
+                for match in _BRACKET.finditer(buf, pos, end):
+                    depth += 1 if match.group() in '[{' else -1
+                    if depth == 0:
+                        self.pos = match.end()
+                        return
+            self.pos = end
+            if quote >= 0:
+                self.pos = self._string_end()
+            elif not self.fill():
+                raise self.error("Unterminated array or object")
+
+    def skip_value(self) -> None:
+        """Discard the value at the cursor, never holding more than a chunk of it."""
+        self._advance_value()
+
+    def read_value(self, in_object: bool = True):
+        """Decode and return the value at the cursor."""
+        self.peek()
+        self.mark = self.pos
+        try:
+            self._advance_value(in_object)
+            return json.loads(self.buf[self.mark:self.pos])
+        finally:
+            self.mark = None
+
+    def mentions(self, needles: Collection[str], lookahead: int) -> bool:
+        """Whether any of needles occurs in the next lookahead characters"""
+        self.peek()
+        while len(self.buf) - self.pos < lookahead and self.fill():
+            pass
+        end = self.pos + lookahead
+        return any(self.buf.find(needle, self.pos, end) >= 0 for needle in needles)
+
+    def try_read_inline(self):
+        """
+        Decode the value at the cursor in a single call if it is complete in
+        the buffer. Returns (True, value), or (False, None) with the cursor
+        unchanged if the value runs past the buffered text (or is malformed).
+        """
+        self.peek()
+        try:
+            value, self.pos = _DECODER.raw_decode(self.buf, self.pos)
+            return True, value
+        except json.JSONDecodeError:
+            return False, None
+
+    def read_string(self) -> str:
+        if self.peek() != '"':
+            raise self.error("Expecting property name enclosed in double quotes")
+        self.mark = self.pos
+        try:
+            self.pos = self._string_end()
+            return json.loads(self.buf[self.mark:self.pos])
+        finally:
+            self.mark = None
+
+    def items(self) -> Iterator[str]:
+        """
+        Iterate over the keys of the object at the cursor. After each key is
+        yielded the cursor sits on its value, which the caller must consume.
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.read_string()
+            self.expect(':')
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == '}':
+                return
+            if char != ',':
+                raise self.error("Expecting ',' delimiter")
+
+
+def _read_object(reader: _Reader, skip_attributes: Collection[str]) -> dict:
+    obj = {}
+    for key in reader.items():
+        if key == 'attributes' and reader.peek() == '{':
+            attributes = {}
+            for prop in reader.items():
+                if prop in skip_attributes:
+                    reader.skip_value()
+                else:
+                    attributes[prop] = reader.read_value()
+            obj[key] = attributes
+        else:
+            obj[key] = reader.read_value()
+    return obj
+
+
+def iter_objects(
+    ifcx_file: IO,
+    skip_attributes: Collection[str] = (),
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[Union[dict, object]]:
+    """
+    Incrementally parse an IFCX document, yielding its top-level entries one at a time.
+
+    The file is read in chunks, so memory use is bounded by the largest entry
+    kept rather than by the size of the file. Attributes named in
+    skip_attributes are absent from the yielded objects. Entries that mention
+    one of them near their start, or that do not fit in the buffered text, are
+    walked key by key so skipped subtrees are stepped over without being
+    decoded; all other entries are decoded in a single call.
+
+    Args:
+        ifcx_file: A binary or text file object positioned at the start of an IFCX document
+        skip_attributes: Attribute names (e.g. 'UsdGeom:Mesh') to drop while parsing
+        chunk_size: Number of bytes to read from the file at a time
+
+    Yields:
+        Each element of the top-level array, usually a dict
+    """
+    reader = _Reader(ifcx_file, chunk_size)
+    needles = [json.dumps(prop) for prop in skip_attributes]
+    reader.expect('[')
+    if reader.peek() == ']':
+        reader.pos += 1
+    else:
+        while True:
+            if reader.peek() != '{':
+                yield reader.read_value(in_object=False)
+            elif needles and reader.mentions(needles, LOOKAHEAD):
+                # Walk objects that carry skipped attributes (typically meshes)
+                # key by key, so the skipped subtrees are never built
+                yield _read_object(reader, skip_attributes)
+            else:
+                inline, obj = reader.try_read_inline()
+                if not inline:
+                    obj = _read_object(reader, skip_attributes)
+                elif needles and isinstance(obj.get('attributes'), dict):
+                    for prop in skip_attributes:
+                        obj['attributes'].pop(prop, None)
+                yield obj
+            char = reader.peek()
+            reader.pos += 1
+            if char == ']':
+                break
+            if char != ',':
+                raise reader.error("Expecting ',' delimiter")
+    if reader.peek() != '':
+        raise reader.error("Extra data")
@@ -0,0 +1,95 @@
+import threading
+import time
+from datetime import datetime
+from logging import log, INFO, ERROR
+from typing import Optional
+
+from ifc_query.util.db import count_sessions, delete_expired_sessions
+
+SWEEP_INTERVAL = 60 * 60
+SWEEP_BATCH_SIZE = 1000
+# Bounds a single sweep; whatever is left is picked up by the next one
+SWEEP_MAX_BATCHES = 100
+
+
+class SessionSweeper:
+    """
+    Periodically deletes expired sessions from a background thread.
+
+    Each sweep deletes in bounded batches (see db.delete_expired_sessions)
+    and records metrics about what it did, available from metrics() and
+    shown on the Admin page. Space freed by deleted rows is reused by later
+    inserts, so the sessions table and its indexes stop growing once expired
+    rows are swept.
+    """
+
+    def __init__(self, interval: float = SWEEP_INTERVAL, batch_size: int = SWEEP_BATCH_SIZE,
+                 max_batches: int = SWEEP_MAX_BATCHES):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._metrics = {
+            'sweeps': 0,
+            'rows_swept_total': 0,
+            'rows_swept_last': 0,
+            'last_sweep_at': None,
+            'last_sweep_seconds': None,
+            'sessions_rows': None,
+            'errors': 0,
+        }
+
+    def sweep(self) -> int:
+        """Run one sweep now, returning the number of sessions deleted"""
+        start = time.perf_counter()
+        n_deleted = delete_expired_sessions(self.batch_size, self.max_batches)
+        n_rows = count_sessions()
+        with self._lock:
+            self._metrics['sweeps'] += 1
+            self._metrics['rows_swept_total'] += n_deleted
+            self._metrics['rows_swept_last'] = n_deleted
+            self._metrics['last_sweep_at'] = datetime.now().isoformat()
+            self._metrics['last_sweep_seconds'] = time.perf_counter() - start
+            self._metrics['sessions_rows'] = n_rows
+        if n_deleted:
+            log(INFO, f"Swept {n_deleted} expired sessions, {n_rows} left")
+        return n_deleted
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                with self._lock:
+                    self._metrics['errors'] += 1
+                log(ERROR, f"Session sweep failed: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        """Start sweeping in the background, does nothing if already started"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='session-sweeper', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def metrics(self) -> dict:
+        """Counters for sweeps run, rows swept and the current size of the sessions table"""
+        with self._lock:
+            return dict(self._metrics)
+
+
+SWEEPER = SessionSweeper()
+
+
+def start_session_sweeper() -> SessionSweeper:
+    """Start the process-wide sweeper, safe to call on every rerun"""
+    SWEEPER.start()
+    return SWEEPER
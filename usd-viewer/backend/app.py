@@ -1 +1,341 @@
- 
\ No newline at end of file
+"""
+Flask backend for the USD viewer.
+
+Serves the composed prim tree of IFCX models as a JSON scene graph, and
+their meshes as binary buffers (little-endian float32 points and uint32
+triangle indices) that the frontend can upload to the GPU as they are,
+without parsing JSON numbers.
+
+Endpoints:
+    GET /api/models                              IFCX files available in MODELS_FOLDER
+    GET /api/models/<model>/scene                Scene graph with world transforms and bounds, referencing buffers by id
+    GET /api/models/<model>/buffers/<buffer_id>  One binary buffer, with Range and ETag support
+    GET|POST /api/models/<model>/stream          Many buffers in one response, see stream_buffers
+
+Every mesh comes in levels of detail, coarsest first (see
+ifc_query.util.lod). To render quickly whatever the size of the model, the
+frontend fetches the scene, streams the coarsest level of every geometry
+(largest first), draws, and then streams the finest level of the
+geometries that are visible.
+
+A model is an IFCX file name without extension, or several joined with '+'
+to compose them as layers, base model first (e.g. hello-wall+hello-wall-add-window).
+
+Usage:
+    MODELS_FOLDER=../../sample-data flask --app app run
+"""
+import hashlib
+import json
+import math
+import os
+import struct
+import sys
+from dataclasses import dataclass, field
+from logging import log, INFO, WARN
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+from flask import Flask, Response, abort, jsonify, request
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'ifc-query'))
+
+from ifc_query.util.cache import TableCache
+from ifc_query.util.compose import Stage
+from ifc_query.util.geometry import XFORM_ATTR, compute_geometry
+from ifc_query.util.lod import cached_lods
+from ifc_query.util.mesh import MESH_ATTR, MeshInterner, buffer_id, mesh_arrays, mesh_key
+from ifc_query.util.session_cache import TTLCache
+from ifc_query.util.stream import iter_objects
+
+MODELS_FOLDER = os.getenv('MODELS_FOLDER', os.path.join(os.path.dirname(__file__), '..', '..', 'sample-data'))
+MAX_SCENES = int(os.getenv('MAX_SCENES', 8))
+
+# Outside the source tree by default, since the caches can take several GB
+CACHE_FOLDER = os.getenv('CACHE_FOLDER', os.path.join(
+    os.getenv('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'usd-viewer'
+))
+
+# Built scenes and simplified meshes survive restarts, so a model is only
+# parsed and simplified once per version of its files. Scenes are kept in
+# memory by get_scene, not by their TableCache.
+SCENE_CACHE = TableCache(os.path.join(CACHE_FOLDER, 'scenes'), max_memory=0, max_disk=4 << 30)
+LOD_CACHE = TableCache(os.path.join(CACHE_FOLDER, 'lods'), max_memory=256 << 20, max_disk=2 << 30)
+
+# Bump whenever the scene format changes, so cached scenes are rebuilt
+SCENE_VERSION = 1
+
+# Each buffer in a stream is preceded by its id (32 ASCII hex digits) and its
+# length in bytes (uint32, little-endian)
+FRAME_HEADER = struct.Struct('<32sI')
+
+VISIBILITY_ATTR = 'UsdGeom:VisibilityAPI:visibility'
+
+app = Flask(__name__)
+
+
+@dataclass
+class Buffer:
+    data: bytes
+    dtype: str
+    components: int
+
+    def describe(self, id_: str) -> dict:
+        return {
+            'id': id_,
+            'dtype': self.dtype,
+            'components': self.components,
+            'count': len(self.data) // (4 * self.components),
+            'byteLength': len(self.data),
+        }
+
+
+@dataclass
+class Scene:
+    """A model parsed once: its scene graph as JSON, and its mesh buffers by id"""
+    json: bytes
+    etag: str
+    buffers: Dict[str, Buffer] = field(default_factory=dict)
+    # Buffer ids of the levels of detail of each geometry, coarsest first
+    lods: Dict[str, List[Tuple[str, str]]] = field(default_factory=dict)
+    # Geometry ids, largest first
+    order: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_parts(cls, scene_json: bytes, buffers: Dict[str, Buffer]) -> 'Scene':
+        scene = json.loads(scene_json)
+        lods = {key: [(lod['points'], lod['indices']) for lod in value['lods']]
+                for key, value in scene['geometries'].items()}
+        etag = hashlib.blake2b(scene_json, digest_size=16).hexdigest()
+        return cls(scene_json, etag, buffers, lods, scene['streamOrder'])
+
+    def to_df(self) -> pd.DataFrame:
+        """The scene as a table for SCENE_CACHE: one row per buffer, and the JSON under an empty id"""
+        return pd.DataFrame({
+            'id': [''] + list(self.buffers),
+            'dtype': [''] + [buffer.dtype for buffer in self.buffers.values()],
+            'components': [0] + [buffer.components for buffer in self.buffers.values()],
+            'data': [self.json] + [buffer.data for buffer in self.buffers.values()],
+        })
+
+    @classmethod
+    def from_df(cls, df: pd.DataFrame) -> 'Scene':
+        rows = df.set_index('id')
+        buffers = {
+            id_: Buffer(row.data, row.dtype, int(row.components))
+            for id_, row in rows.drop(index='').iterrows()
+        }
+        return cls.from_parts(rows.loc['', 'data'], buffers)
+
+
+def _model_paths(model: str) -> List[str]:
+    """The IFCX files of a model id, refusing anything outside MODELS_FOLDER"""
+    available = set(os.listdir(MODELS_FOLDER))
+    paths = []
+    for name in model.split('+'):
+        filename = f"{name}.ifcx"
+        if filename not in available:
+            abort(404, f"No model named {name}")
+        paths.append(os.path.join(MODELS_FOLDER, filename))
+    return paths
+
+
+def build_scene(paths: List[str]) -> Scene:
+    """
+    Compose the IFCX layers and convert them to a scene graph and buffers.
+
+    Nodes are listed depth first, each with the index of its parent, so the
+    frontend can build the hierarchy in one pass. Each carries its local and
+    world transforms and its world bounding box (including its descendants),
+    so the frontend can place and cull prims before their meshes arrive.
+
+    Identical meshes, whether shared through a class or repeated under
+    different class names, are listed once in 'geometries', with the buffers
+    of their levels of detail; nodes reference them by id, so they are
+    instances of it placed by their world transform.
+    """
+    meshes = MeshInterner()
+    files = [open(path, 'rb') for path in paths]
+    try:
+        stage = Stage(meshes.intern_objects(iter_objects(f)) for f in files)
+    finally:
+        for f in files:
+            f.close()
+    meshes.report()
+
+    buffers: Dict[str, Buffer] = {}
+    geometries: Dict[str, dict] = {}
+    geometry_ids: Dict[int, Optional[str]] = {}
+    extents: Dict[str, float] = {}
+    nodes = []
+    geometry = compute_geometry(stage)
+    hierarchy = geometry.hierarchy
+    has_bbox = geometry.has_bbox()
+
+    def add_buffer(array, dtype: str, components: int) -> str:
+        id_ = buffer_id(array)
+        if id_ not in buffers:
+            buffers[id_] = Buffer(array.astype(f"<{dtype[0]}4").tobytes(), dtype, components)
+        return id_
+
+    for i, (path, prim) in enumerate(zip(hierarchy.paths, hierarchy.prims)):
+        attributes = prim.attributes
+        mesh_value = attributes.get(MESH_ATTR)
+        geometry_id = None
+        if mesh_value is not None:
+            # Interned meshes are shared, so each geometry is hashed and converted once
+            if id(mesh_value) not in geometry_ids:
+                try:
+                    key = mesh_key(mesh_value)
+                    lods = None
+                    if key is not None and key not in geometries:
+                        lods = cached_lods(key, mesh_arrays(mesh_value), LOD_CACHE)
+                except (TypeError, ValueError, IndexError) as e:
+                    log(WARN, f"Not serving the mesh of {path}: {e}")
+                    key = None
+                else:
+                    if lods is not None:
+                        geometries[key] = {
+                            'lods': [
+                                {
+                                    'points': add_buffer(lod.points, 'float32', 3),
+                                    'indices': add_buffer(lod.indices, 'uint32', 1),
+                                    'vertexCount': len(lod.points),
+                                    'triangleCount': lod.n_triangles,
+                                }
+                                for lod in lods
+                            ],
+                            'instances': 0,
+                        }
+                geometry_ids[id(mesh_value)] = key
+            geometry_id = geometry_ids[id(mesh_value)]
+            if geometry_id is not None:
+                geometries[geometry_id]['instances'] += 1
+                if has_bbox[i]:
+                    extent = float(((geometry.bbox_max[i] - geometry.bbox_min[i]) ** 2).sum() ** 0.5)
+                    extents[geometry_id] = max(extents.get(geometry_id, 0.0), extent)
+
+        visibility = attributes.get(VISIBILITY_ATTR)
+        parent = int(hierarchy.parents[i])
+        nodes.append({
+            'path': path,
+            'name': prim.name,
+            'type': prim.type,
+            'parent': parent if parent >= 0 else None,
+            'transform': (attributes.get(XFORM_ATTR) or {}).get('transform'),
+            'world': geometry.world[i].tolist(),
+            'bbox': {'min': geometry.bbox_min[i].tolist(), 'max': geometry.bbox_max[i].tolist()} if has_bbox[i] else None,
+            'visible': not (isinstance(visibility, dict) and visibility.get('visibility') == 'invisible'),
+            'geometry': geometry_id,
+        })
+
+    scene_json = json.dumps({
+        'nodes': nodes,
+        'geometries': geometries,
+        'buffers': {id_: buffer.describe(id_) for id_, buffer in buffers.items()},
+        # The order stream_buffers sends geometries in by default
+        'streamOrder': sorted(geometries, key=lambda key: extents.get(key, 0.0), reverse=True),
+    }, separators=(',', ':')).encode()
+    log(INFO, f"Built scene for {paths}: {len(nodes)} nodes, {len(geometries)} geometries, {len(buffers)} buffers")
+    return Scene.from_parts(scene_json, buffers)
+
+
+# Scenes in memory by the paths, mtimes and sizes of their files; concurrent
+# requests for a model that is not loaded yet wait for a single build, while
+# requests for other models go ahead
+_scenes = TTLCache(math.inf, max_entries=MAX_SCENES)
+
+
+def get_scene(model: str) -> Scene:
+    """The scene of a model, rebuilt only when one of its files changes"""
+    paths = _model_paths(model)
+    key: Tuple = tuple((os.path.abspath(path), os.stat(path).st_mtime_ns, os.stat(path).st_size) for path in paths)
+
+    def load() -> Scene:
+        cache_key = hashlib.blake2b(f"scene:{SCENE_VERSION}:{key}".encode(), digest_size=20).hexdigest()
+        return Scene.from_df(SCENE_CACHE.get_or_build(cache_key, lambda: build_scene(paths).to_df()))
+
+    return _scenes.get_or_load(key, load)
+
+
+def _conditional(response: Response, etag: str, immutable: bool = False, length: Optional[int] = None) -> Response:
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable' if immutable else 'no-cache'
+    return response.make_conditional(request, accept_ranges=length is not None, complete_length=length)
+
+
+@app.get('/api/models')
+def list_models():
+    names = sorted(name[:-len('.ifcx')] for name in os.listdir(MODELS_FOLDER) if name.endswith('.ifcx'))
+    return jsonify([{'id': name} for name in names])
+
+
+@app.get('/api/models/<model>/scene')
+def scene_graph(model: str):
+    scene = get_scene(model)
+    return _conditional(Response(scene.json, mimetype='application/json'), scene.etag)
+
+
+@app.get('/api/models/<model>/buffers/<buffer_id>')
+def buffer(model: str, buffer_id: str):
+    scene = get_scene(model)
+    data = scene.buffers.get(buffer_id)
+    if data is None:
+        abort(404, f"No buffer {buffer_id} in {model}")
+    # Buffer ids are content hashes, so a buffer never changes under its URL
+    response = Response(data.data, mimetype='application/octet-stream')
+    response.headers['X-Buffer-Dtype'] = data.dtype
+    response.headers['X-Buffer-Components'] = str(data.components)
+    return _conditional(response, buffer_id, immutable=True, length=len(data.data))
+
+
+@app.route('/api/models/<model>/stream', methods=['GET', 'POST'])
+def stream_buffers(model: str):
+    """
+    Stream the buffers of a level of detail of many geometries in one response.
+
+    Parameters, as query arguments or a JSON body:
+        lod: Level of detail, 0 for the coarsest (default) and -1 for the
+            finest; geometries with fewer levels send their nearest one
+        geometries: Geometry ids, comma-separated in a query, defaults to
+            every geometry, largest first
+
+    Buffers are sent as frames, see FRAME_HEADER, each one as soon as it is
+    written, so the frontend can draw geometries while the rest arrive.
+    Buffers shared by several geometries or levels are sent once.
+    """
+    scene = get_scene(model)
+    params = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
+    if not isinstance(params, dict):
+        abort(400, "The request body must be a JSON object")
+    try:
+        level = int(params.get('lod', 0))
+    except (TypeError, ValueError):
+        abort(400, "lod must be an integer")
+    geometry_ids = params.get('geometries')
+    if geometry_ids is None:
+        geometry_ids = scene.order
+    elif isinstance(geometry_ids, str):
+        geometry_ids = [id_ for id_ in geometry_ids.split(',') if id_]
+    elif not isinstance(geometry_ids, list) or not all(isinstance(id_, str) for id_ in geometry_ids):
+        abort(400, "geometries must be a list of geometry ids")
+    unknown = [id_ for id_ in geometry_ids if id_ not in scene.lods]
+    if unknown:
+        abort(404, f"No geometry {unknown[0]} in {model}")
+
+    def frames():
+        sent = set()
+        for geometry_id in geometry_ids:
+            lods = scene.lods[geometry_id]
+            index = min(level, len(lods) - 1) if level >= 0 else max(level, -len(lods))
+            for id_ in lods[index]:
+                if id_ not in sent:
+                    sent.add(id_)
+                    data = scene.buffers[id_].data
+                    yield FRAME_HEADER.pack(id_.encode(), len(data))
+                    yield data
+
+    return Response(frames(), mimetype='application/octet-stream', headers={'Cache-Control': 'no-cache'})
+
+
+if __name__ == '__main__':
+    app.run(port=int(os.getenv('PORT', 5000)), threaded=True)